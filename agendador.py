@@ -0,0 +1,317 @@
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+import pytz
+import pandas as pd
+import analise
+import armazenamento
+import graficos
+import relatorios
+from calculo import ALVO
+from usuarios import listar_usuarios
+
+# --- RELATÓRIOS PRONTOS (GERADOS EM SEGUNDO PLANO) ---
+# Os PDFs semanal (7 dias) e mensal (30 dias), terminando hoje, são montados por uma
+# fila de trabalho fora do rerun. O botão de download só lê o arquivo pronto.
+#   relatorios_prontos/{usuario}/{tipo}.pdf   o relatório
+#   relatorios_prontos/{usuario}/{tipo}.json  de que dados ele saiu (versão, período, conteúdo)
+# Quando um relatório é pedido de novo:
+#   - versão dos dados e período iguais: não faz nada;
+#   - versão diferente mas mesmos registros no período (ex.: compactação, ou leitura
+#     fora do período): só atualiza o .json;
+#   - senão, gera o PDF de novo.
+# A fila tem tamanho máximo (pedido com a fila cheia é descartado e volta na próxima
+# varredura) e não guarda o mesmo (usuário, tipo) duas vezes. Falha é tentada de novo
+# até TENTATIVAS vezes, esperando mais a cada vez.
+# Os pedidos vêm de gravações neste processo (aviso do armazenamento) e de uma
+# varredura periódica de todos os usuários (pega gravações de outros processos e a
+# virada do dia). Também roda sozinho:
+#   python agendador.py            fica varrendo a cada --intervalo segundos
+#   python agendador.py --uma-vez  põe tudo em dia e sai
+
+PASTA_RELATORIOS = "relatorios_prontos"
+PERIODOS = {"semanal": (7, "Semanal"), "mensal": (30, "Mensal")}
+FUSO_HORARIO = pytz.timezone("America/Sao_Paulo")  # o mesmo do app
+METRICAS_PDF = ["Glicemia"]
+TRABALHADORES = 2
+MAX_FILA = 64
+TENTATIVAS = 3
+ESPERA_TENTATIVA = 2  # segundos; dobra a cada nova tentativa
+INTERVALO_VARREDURA = 600
+MAX_HISTORICO = 50
+CONTADOR_DO_RESULTADO = {"gerado": "gerados", "sem_mudanca": "sem_mudanca", "em_dia": "em_dia", "falha": "falhas"}
+
+
+# --- ARQUIVOS DO CACHE DE RELATÓRIOS ---
+def arquivo_db_do_usuario(usuario):
+    return f"db_{usuario}.csv"
+
+def caminho_relatorio(usuario, tipo):
+    return os.path.join(PASTA_RELATORIOS, usuario, f"{tipo}.pdf")
+
+def _caminho_meta(usuario, tipo):
+    return os.path.join(PASTA_RELATORIOS, usuario, f"{tipo}.json")
+
+def hoje_no_fuso():
+    # O "hoje" dos registros (gravados na hora de Brasília), não o do relógio do servidor
+    return datetime.now(FUSO_HORARIO).date()
+
+def periodo(tipo, hoje=None):
+    fim = hoje or hoje_no_fuso()
+    return fim - timedelta(days=PERIODOS[tipo][0] - 1), fim
+
+def ler_meta(usuario, tipo):
+    try:
+        with open(_caminho_meta(usuario, tipo), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _gravar_atomico(caminho, conteudo):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    tmp = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(conteudo)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, caminho)
+
+def _em_dia(meta, versao, fim):
+    return meta is not None and meta["versao"] == repr(versao) and meta["fim"] == fim.isoformat()
+
+def situacao(usuario, tipo):
+    # Devolve (meta ou None se ainda não há PDF, em_dia). Um PDF desatualizado continua
+    # disponível (a tela avisa de quando ele é) enquanto o novo não fica pronto
+    if not os.path.exists(caminho_relatorio(usuario, tipo)):
+        return None, False
+    meta = ler_meta(usuario, tipo)
+    return meta, _em_dia(meta, armazenamento.versao(arquivo_db_do_usuario(usuario)), periodo(tipo)[1])
+
+def ler_relatorio(usuario, tipo):
+    with open(caminho_relatorio(usuario, tipo), "rb") as f:
+        return f.read()
+
+def gerar_relatorio(usuario, tipo, hoje=None):
+    arquivo_db = arquivo_db_do_usuario(usuario)
+    inicio, fim = periodo(tipo, hoje)
+    # A versão é lida antes dos dados: se alguém gravar no meio, o .json fica com a
+    # versão antiga e o relatório é refeito no próximo pedido
+    versao = armazenamento.versao(arquivo_db)
+    meta = ler_meta(usuario, tipo)
+    if _em_dia(meta, versao, fim) and os.path.exists(caminho_relatorio(usuario, tipo)):
+        return "em_dia"
+
+    df = armazenamento.consultar_periodo(arquivo_db, inicio, fim)
+    conteudo = str(int(pd.util.hash_pandas_object(df[armazenamento.COLUNAS_DADOS], index=False).sum()))
+    novo_meta = {"versao": repr(versao), "conteudo": conteudo, "inicio": inicio.isoformat(),
+                 "fim": fim.isoformat(), "registros": len(df)}
+    if (meta is not None and meta.get("conteudo") == conteudo and meta["fim"] == novo_meta["fim"]
+            and os.path.exists(caminho_relatorio(usuario, tipo))):
+        novo_meta["gerado_em"] = meta["gerado_em"]
+        _gravar_atomico(_caminho_meta(usuario, tipo), json.dumps(novo_meta).encode("utf-8"))
+        return "sem_mudanca"
+
+    grafico_png = graficos.renderizar_grafico(df, METRICAS_PDF, ALVO) if not df.empty else None
+    resultado = analise.analisar_df(df)
+    agp_png = graficos.renderizar_agp(resultado["agp"], analise.FAIXA_ALVO) if resultado["metricas"]["leituras"] else None
+    filtro_msg = f"{PERIODOS[tipo][1]}: {inicio.strftime('%d/%m')} a {fim.strftime('%d/%m')}"
+    pdf = relatorios.gerar_pdf(df, usuario, filtro_msg, grafico_png, analise.texto_metricas(resultado["metricas"]), agp_png)
+    novo_meta["gerado_em"] = datetime.now().isoformat(timespec="seconds")
+    # PDF primeiro: o .json só diz "em dia" depois que o arquivo novo já está no lugar
+    _gravar_atomico(caminho_relatorio(usuario, tipo), pdf)
+    _gravar_atomico(_caminho_meta(usuario, tipo), json.dumps(novo_meta).encode("utf-8"))
+    return "gerado"
+
+
+# --- FILA DE TRABALHO ---
+class Agendador:
+    def __init__(self, trabalhadores=TRABALHADORES, max_fila=MAX_FILA, intervalo=INTERVALO_VARREDURA):
+        self.trabalhadores = trabalhadores
+        self.intervalo = intervalo
+        self.fila = queue.Queue(maxsize=max_fila)
+        self._pendentes = set()
+        self._em_andamento = {}
+        self._guarda = threading.Lock()
+        self._parar = threading.Event()
+        self._threads = []
+        self.contagem = {"enfileirados": 0, "descartados": 0, "gerados": 0, "sem_mudanca": 0,
+                         "em_dia": 0, "falhas": 0, "novas_tentativas": 0}
+        self.historico = deque(maxlen=MAX_HISTORICO)
+        self.ultima_varredura = None
+
+    def iniciar(self, varredura=True):
+        for i in range(self.trabalhadores):
+            t = threading.Thread(target=self._trabalhar, name=f"agendador-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        if varredura:
+            t = threading.Thread(target=self._varrer_sempre, name="agendador-varredura", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def parar(self):
+        self._parar.set()
+        for t in self._threads:
+            t.join(timeout=5)
+
+    def enfileirar(self, usuario, tipo):
+        with self._guarda:
+            if (usuario, tipo) in self._pendentes:
+                return True
+            try:
+                self.fila.put_nowait((usuario, tipo))
+            except queue.Full:
+                self.contagem["descartados"] += 1
+                return False
+            self._pendentes.add((usuario, tipo))
+            self.contagem["enfileirados"] += 1
+            return True
+
+    def enfileirar_usuario(self, usuario):
+        for tipo in PERIODOS:
+            self.enfileirar(usuario, tipo)
+
+    def varrer(self):
+        # Só olha versão e .json: usuário em dia não entra na fila
+        for usuario in listar_usuarios():
+            versao = armazenamento.versao(arquivo_db_do_usuario(usuario))
+            if all(parte is None for parte in versao):
+                continue  # ainda sem nenhum registro
+            for tipo in PERIODOS:
+                if not _em_dia(ler_meta(usuario, tipo), versao, periodo(tipo)[1]):
+                    self.enfileirar(usuario, tipo)
+        self.ultima_varredura = datetime.now().isoformat(timespec="seconds")
+
+    def aguardar(self):
+        self.fila.join()
+
+    def ao_alterar(self, evento, arquivo_db, antes, depois, linhas):
+        # Aviso do armazenamento (roda dentro da trava do usuário): só enfileira
+        if evento == "compactacao":
+            return
+        nome = os.path.basename(arquivo_db)
+        if nome.startswith("db_"):
+            self.enfileirar_usuario(os.path.splitext(nome)[0][len("db_"):])
+
+    def _varrer_sempre(self):
+        while not self._parar.is_set():
+            try:
+                self.varrer()
+            except Exception as erro:
+                self.historico.append({"hora": datetime.now().isoformat(timespec="seconds"),
+                                       "usuario": "-", "tipo": "varredura", "resultado": "falha",
+                                       "erro": repr(erro)})
+            self._parar.wait(self.intervalo)
+
+    def _trabalhar(self):
+        while not self._parar.is_set():
+            try:
+                tarefa = self.fila.get(timeout=1)
+            except queue.Empty:
+                continue
+            with self._guarda:
+                # Sai dos pendentes já: uma gravação durante a geração pede outra rodada
+                self._pendentes.discard(tarefa)
+                self._em_andamento[threading.current_thread().name] = tarefa
+            try:
+                self._executar(*tarefa)
+            finally:
+                with self._guarda:
+                    self._em_andamento.pop(threading.current_thread().name, None)
+                self.fila.task_done()
+
+    def _executar(self, usuario, tipo):
+        inicio = time.perf_counter()
+        registro = {"hora": datetime.now().isoformat(timespec="seconds"), "usuario": usuario, "tipo": tipo}
+        for tentativa in range(1, TENTATIVAS + 1):
+            try:
+                resultado = gerar_relatorio(usuario, tipo)
+                registro.update(resultado=resultado, erro=None)
+                break
+            except Exception as erro:
+                registro.update(resultado="falha", erro=repr(erro))
+                if tentativa == TENTATIVAS or self._parar.wait(ESPERA_TENTATIVA * 2 ** (tentativa - 1)):
+                    break
+                with self._guarda:
+                    self.contagem["novas_tentativas"] += 1
+        registro.update(tentativas=tentativa, segundos=round(time.perf_counter() - inicio, 3))
+        with self._guarda:
+            self.contagem[CONTADOR_DO_RESULTADO[registro["resultado"]]] += 1
+            self.historico.append(registro)
+
+    def estado(self):
+        with self._guarda:
+            return {"fila": self.fila.qsize(), "max_fila": self.fila.maxsize,
+                    "trabalhadores": self.trabalhadores,
+                    "em_andamento": [f"{u}/{t}" for u, t in self._em_andamento.values()],
+                    "ultima_varredura": self.ultima_varredura, **self.contagem,
+                    "historico": list(self.historico)[::-1]}
+
+    def metricas(self):
+        # Números para o diagnostico.registrar_coletor
+        estado = self.estado()
+        return {nome: estado[nome] for nome in ["fila", "enfileirados", "descartados", "gerados",
+                                                "sem_mudanca", "em_dia", "falhas", "novas_tentativas"]}
+
+
+# --- UM AGENDADOR POR PROCESSO ---
+_agendador = None
+_agendador_guarda = threading.Lock()
+
+def iniciar(trabalhadores=TRABALHADORES, varredura=True):
+    global _agendador
+    with _agendador_guarda:
+        if _agendador is None:
+            _agendador = Agendador(trabalhadores).iniciar(varredura)
+            armazenamento.registrar_ouvinte(_agendador.ao_alterar)
+        return _agendador
+
+
+# --- LINHA DE COMANDO ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera os relatórios semanal e mensal de todos os usuários.")
+    parser.add_argument("--trabalhadores", type=int, default=TRABALHADORES)
+    parser.add_argument("--intervalo", type=int, default=INTERVALO_VARREDURA, help="segundos entre varreduras")
+    parser.add_argument("--uma-vez", action="store_true", help="põe tudo em dia e sai")
+    args = parser.parse_args(argv)
+
+    agendador = Agendador(args.trabalhadores, intervalo=args.intervalo)
+    if args.uma_vez:
+        agendador.iniciar(varredura=False)
+        inicio = time.perf_counter()
+        # Com mais pedidos que a fila comporta, varre de novo até nada ser descartado
+        while True:
+            descartados = agendador.contagem["descartados"]
+            agendador.varrer()
+            agendador.aguardar()
+            if agendador.contagem["descartados"] == descartados:
+                break
+        estado = agendador.estado()
+        print(f"{estado['gerados']} gerados, {estado['sem_mudanca']} sem mudança, {estado['em_dia']} em dia, "
+              f"{estado['falhas']} falhas em {time.perf_counter() - inicio:.1f}s")
+        for r in estado["historico"]:
+            if r["resultado"] == "falha":
+                print(f"  {r['usuario']}/{r['tipo']}: {r['erro']}", file=sys.stderr)
+        agendador.parar()
+        return 1 if estado["falhas"] else 0
+
+    agendador.iniciar()
+    try:
+        while True:
+            time.sleep(args.intervalo)
+            estado = agendador.estado()
+            print(f"[{datetime.now():%H:%M:%S}] fila {estado['fila']}, {estado['gerados']} gerados, "
+                  f"{estado['falhas']} falhas", flush=True)
+    except KeyboardInterrupt:
+        agendador.parar()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
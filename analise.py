@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import armazenamento
+
+# --- ANÁLISE GLICÊMICA DO PERÍODO ---
+# Indicadores do consenso internacional de tempo no alvo:
+#   tir           % das leituras entre 70 e 180 mg/dL
+#   abaixo/acima  % abaixo de 70 / acima de 180 (muito_abaixo < 54, muito_acima > 250)
+#   cv            coeficiente de variação (desvio / média, em %); estável até 36%
+#   gmi           glicose média estimada como HbA1c: 3,31 + 0,02392 x média (mg/dL)
+# AGP (perfil ambulatorial de glicose): percentis 10/25/50/75/90 por hora do dia,
+# juntando todos os dias do período.
+# Glicemia 0 = não informada: fica fora de tudo. Tudo vetorizado (numpy + groupby), e o
+# resultado fica em cache por (usuário, período, versão dos dados).
+
+FAIXA_ALVO = (70, 180)
+MUITO_BAIXO, MUITO_ALTO = 54, 250
+LIMITE_CV = 36
+PERCENTIS_AGP = [10, 25, 50, 75, 90]
+MAX_ANALISES_EM_CACHE = 64
+
+_cache_analises = OrderedDict()
+_cache_guarda = threading.Lock()
+
+
+def _glicemias(df):
+    glicemia = pd.to_numeric(df['Glicemia'], errors="coerce")
+    return glicemia[glicemia > 0]
+
+def _percentual(mascara):
+    return 100 * float(np.count_nonzero(mascara)) / len(mascara)
+
+def gmi(media):
+    return 3.31 + 0.02392 * media
+
+def metricas(df):
+    glicemia = _glicemias(df)
+    valores = glicemia.to_numpy(dtype=float)
+    n = len(valores)
+    if n == 0:
+        return {"leituras": 0, "media": None, "desvio": None, "cv": None, "gmi": None, "tir": None,
+                "abaixo": None, "muito_abaixo": None, "acima": None, "muito_acima": None}
+    baixo, alto = FAIXA_ALVO
+    media = float(valores.mean())
+    desvio = float(valores.std(ddof=1)) if n > 1 else 0.0
+    return {
+        "leituras": n,
+        "media": media,
+        "desvio": desvio,
+        "cv": 100 * desvio / media,
+        "gmi": gmi(media),
+        "tir": _percentual((valores >= baixo) & (valores <= alto)),
+        "abaixo": _percentual(valores < baixo),
+        "muito_abaixo": _percentual(valores < MUITO_BAIXO),
+        "acima": _percentual(valores > alto),
+        "muito_acima": _percentual(valores > MUITO_ALTO),
+    }
+
+def perfil_agp(df):
+    # Uma linha por hora que tem leitura: P10..P90 e quantas leituras entraram
+    glicemia = _glicemias(df)
+    colunas = [f"P{p}" for p in PERCENTIS_AGP]
+    if glicemia.empty:
+        return pd.DataFrame(columns=colunas + ["leituras"], index=pd.Index([], name="hora"))
+    hora = df.loc[glicemia.index, 'Data_DT'].dt.hour.rename("hora")
+    grupos = glicemia.astype(float).groupby(hora)
+    agp = grupos.quantile([p / 100 for p in PERCENTIS_AGP]).unstack()
+    agp.columns = colunas
+    agp["leituras"] = grupos.size()
+    return agp
+
+def analisar_df(df):
+    return {"metricas": metricas(df), "agp": perfil_agp(df)}
+
+def analisar(arquivo_db, inicio=None, fim=None):
+    chave = (arquivo_db, inicio, fim, armazenamento.versao(arquivo_db))
+    with _cache_guarda:
+        if chave in _cache_analises:
+            _cache_analises.move_to_end(chave)
+            return _cache_analises[chave]
+    resultado = analisar_df(armazenamento.consultar_periodo(arquivo_db, inicio, fim))
+    with _cache_guarda:
+        _cache_analises[chave] = resultado
+        while len(_cache_analises) > MAX_ANALISES_EM_CACHE:
+            _cache_analises.popitem(last=False)
+    return resultado
+
+def texto_metricas(m):
+    # Linhas para o PDF (sem acento, como o resto do relatório)
+    if not m["leituras"]:
+        return ["Sem leituras de glicemia no periodo."]
+    return [
+        f"Tempo no alvo (70-180): {m['tir']:.0f}%  |  Abaixo de 70: {m['abaixo']:.0f}% "
+        f"(<54: {m['muito_abaixo']:.0f}%)  |  Acima de 180: {m['acima']:.0f}% (>250: {m['muito_acima']:.0f}%)",
+        f"Media: {m['media']:.0f} mg/dL  |  CV: {m['cv']:.0f}%  |  GMI: {m['gmi']:.1f}%  |  "
+        f"Leituras: {m['leituras']}",
+    ]
@@ -1,17 +1,17 @@
+import os
+import hmac
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
-from fpdf import FPDF
-import pytz
-import urllib.parse
-import os
+# A tela de login só precisa disto. pandas, matplotlib e fpdf são importados mais
+# abaixo, na primeira vez que a área logada / os relatórios são alcançados.
+from usuarios import cadastrar_usuario, verificar_login, resetar_senha, apagar_todos
+import diagnostico
 
 # --- CONFIGURAÇÕES DA PÁGINA ---
 st.set_page_config(page_title="Calculadora Insulina", page_icon="💉")
 
-# --- ARQUIVO DE USUÁRIOS ---
-ARQUIVO_USUARIOS = "usuarios_cadastrados.csv"
+# Tempo de cada parte deste rerun (painel "Diagnóstico" no fim da barra lateral)
+diagnostico.iniciar_rerun(st.session_state.get("usuario_logado"))
 
 # --- TRUQUE DE CSS (ESTILO) ---
 st.markdown("""
@@ -40,83 +40,43 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# --- PARÂMETROS FIXOS ---
-ALVO = 100
-FATOR_SENSIBILIDADE = 40
-
-# --- FUNÇÕES DE USUÁRIOS (BLINDADAS) ---
-def carregar_usuarios():
-    if os.path.exists(ARQUIVO_USUARIOS):
-        # DTYPE=STR É O SEGREDO: FORÇA TUDO A SER TEXTO
-        df = pd.read_csv(ARQUIVO_USUARIOS, dtype=str)
-        df = df.fillna("") # Remove vazios
-        return df
-    else:
-        return pd.DataFrame(columns=["usuario", "senha", "palavra_secreta"])
-
-def cadastrar_usuario(usuario, senha, palavra_secreta):
-    # Converte tudo para string e limpa espaços
-    usuario = str(usuario).lower().strip().replace(" ", "")
-    senha = str(senha).strip()
-    palavra_secreta = str(palavra_secreta).lower().strip()
-    
-    if len(usuario) < 3: return False, "❌ O usuário deve ter pelo menos 3 letras."
-    if len(senha) < 4: return False, "❌ A senha deve ter pelo menos 4 caracteres."
-    if len(palavra_secreta) < 2: return False, "❌ A palavra secreta é muito curta."
-    
-    df = carregar_usuarios()
-    
-    # Garante que a coluna usuario do DF também esteja limpa para comparar
-    if not df.empty:
-        df['usuario'] = df['usuario'].astype(str).str.lower().str.strip()
-        
-    if usuario in df['usuario'].values:
-        return False, "❌ Este usuário já existe! Tente outro."
-    
-    novo_usuario = pd.DataFrame([{"usuario": usuario, "senha": senha, "palavra_secreta": palavra_secreta}])
-    df_final = pd.concat([df, novo_usuario], ignore_index=True)
-    df_final.to_csv(ARQUIVO_USUARIOS, index=False)
-    return True, "✅ Cadastro realizado com sucesso!"
-
-def verificar_login(usuario, senha):
-    # Limpeza rigorosa da entrada
-    usuario = str(usuario).lower().strip()
-    senha = str(senha).strip()
-    
-    df = carregar_usuarios()
-    if df.empty: return False
-    
-    # Limpeza rigorosa do banco de dados antes de comparar
-    df['usuario'] = df['usuario'].astype(str).str.lower().str.strip()
-    df['senha'] = df['senha'].astype(str).str.strip()
-    
-    usuario_encontrado = df[(df['usuario'] == usuario) & (df['senha'] == senha)]
-    return not usuario_encontrado.empty
-
-def resetar_senha(usuario, palavra_secreta, nova_senha):
-    usuario = str(usuario).lower().strip()
-    palavra_secreta = str(palavra_secreta).lower().strip()
-    nova_senha = str(nova_senha).strip()
-    
-    df = carregar_usuarios()
-    if df.empty: return False, "❌ Nenhum usuário cadastrado."
-    
-    df['usuario'] = df['usuario'].astype(str).str.lower().str.strip()
-    df['palavra_secreta'] = df['palavra_secreta'].astype(str).str.lower().str.strip()
-    
-    mask = (df['usuario'] == usuario) & (df['palavra_secreta'] == palavra_secreta)
-    
-    if not df[mask].empty:
-        df.loc[mask, 'senha'] = nova_senha
-        df.to_csv(ARQUIVO_USUARIOS, index=False)
-        return True, "✅ Senha alterada com sucesso!"
-    else:
-        return False, "❌ Usuário ou Palavra Secreta incorretos."
-
 # --- SISTEMA DE LOGIN ---
+# A aba da equipe clínica só aparece quando CALC_SENHA_CLINICA está definida
+SENHA_CLINICA = os.environ.get("CALC_SENHA_CLINICA")
+
 if 'usuario_logado' not in st.session_state:
     st.session_state.usuario_logado = None
 
+# --- PAINEL DA EQUIPE CLÍNICA (SÓ LEITURA) ---
+if st.session_state.get("modo_clinico") and SENHA_CLINICA:
+    import painel_clinico
+    st.title("🩺 Painel da Equipe Clínica")
+    with st.sidebar:
+        if st.button("Sair"):
+            st.session_state.modo_clinico = False
+            st.rerun()
+
+    hoje = datetime.now().date()
+    periodo_clinico = st.date_input("Período", value=(hoje - timedelta(days=29), hoje), format="DD/MM/YYYY")
+    if isinstance(periodo_clinico, tuple) and len(periodo_clinico) == 2:
+        with diagnostico.medir("painel_clinico"):
+            tabela_coorte, varredura = painel_clinico.resumo_coorte(*periodo_clinico)
+        st.caption(f"{varredura['pacientes']} pacientes em {varredura['segundos']:.2f}s "
+                   f"({varredura['lidos']} lidos, {varredura['do_cache']} sem mudança)")
+        for erro in varredura['erros']:
+            st.warning(f"Não foi possível ler {erro['Paciente']}: {erro['erro']}")
+        # Clique no cabeçalho da coluna para ordenar
+        st.dataframe(tabela_coorte, hide_index=True, width="stretch", column_config={
+            "Glicemia Média": st.column_config.NumberColumn(format="%.1f"),
+            "% Hipo": st.column_config.NumberColumn(format="%.1f%%"),
+            "Insulina Total (u)": st.column_config.NumberColumn(format="%.1f"),
+            "Último Registro": st.column_config.DatetimeColumn(format="DD/MM/YYYY HH:mm"),
+        })
+    else:
+        st.info("Escolha a data final do período.")
+    diagnostico.finalizar_rerun()
+    st.stop()
+
 if st.session_state.usuario_logado is None:
     st.title("🔐 Acesso ao Diário")
     
@@ -124,14 +84,17 @@ if st.session_state.usuario_logado is None:
     with st.sidebar:
         st.warning("🔧 Área de Manutenção")
         if st.button("⚠️ Resetar Cadastro (Apagar Tudo)"):
-            if os.path.exists(ARQUIVO_USUARIOS):
-                os.remove(ARQUIVO_USUARIOS)
+            if apagar_todos():
                 st.success("Banco de usuários resetado! Cadastre-se novamente.")
                 st.rerun()
             else:
                 st.info("Já está limpo.")
 
-    tab1, tab2, tab3 = st.tabs(["Entrar", "Criar Nova Conta", "Recuperar Senha"])
+    nomes_abas = ["Entrar", "Criar Nova Conta", "Recuperar Senha"]
+    if SENHA_CLINICA:
+        nomes_abas.append("🩺 Equipe Clínica")
+    abas = st.tabs(nomes_abas)
+    tab1, tab2, tab3 = abas[:3]
     
     # ABA 1: LOGIN
     with tab1:
@@ -140,7 +103,9 @@ if st.session_state.usuario_logado is None:
         login_pass = st.text_input("Senha", type="password", key="login_p")
         
         if st.button("ENTRAR", type="primary"):
-            if verificar_login(login_user, login_pass):
+            with diagnostico.medir("login"):
+                login_ok = verificar_login(login_user, login_pass)
+            if login_ok:
                 st.session_state.usuario_logado = login_user
                 st.rerun()
             else:
@@ -192,80 +157,51 @@ if st.session_state.usuario_logado is None:
                         st.error(msg)
             else:
                 st.warning("Preencha todos os campos.")
+
+    # ABA 4: EQUIPE CLÍNICA (resumo de todos os pacientes, sem acesso para editar)
+    if SENHA_CLINICA:
+        with abas[3]:
+            with st.form("form_clinica"):
+                senha_clinica = st.text_input("Senha da equipe clínica", type="password")
+                submit_clinica = st.form_submit_button("ABRIR PAINEL")
+            if submit_clinica:
+                if hmac.compare_digest(senha_clinica.encode(), SENHA_CLINICA.encode()):
+                    st.session_state.modo_clinico = True
+                    st.rerun()
+                else:
+                    st.error("Senha incorreta.")
     
+    diagnostico.finalizar_rerun()
     st.stop()
 
 # 
 # USUÁRIO LOGADO
 # 
 
+with diagnostico.medir("importar_area_logada"):
+    import pandas as pd
+    import pytz
+    import armazenamento
+    from calculo import ALVO, FATOR_SENSIBILIDADE, calcular_dose, eh_hipoglicemia
+diagnostico.registrar_coletor("cache", armazenamento.estatisticas_cache)
+
 usuario_atual = st.session_state.usuario_logado
 ARQUIVO_DB = f"db_{usuario_atual}.csv"
+REGISTROS_POR_PAGINA = 50
 
 # --- FUNÇÕES DE BANCO DE DADOS ---
 def carregar_dados():
-    if os.path.exists(ARQUIVO_DB):
-        df = pd.read_csv(ARQUIVO_DB)
-        try:
-            df['Data_DT'] = pd.to_datetime(df['Data'], format="%d/%m/%Y %H:%M")
-        except:
-            pass
-        return df
-    else:
-        return pd.DataFrame(columns=["Data", "Glicemia", "Carbos", "ICR", "Dose"])
+    with diagnostico.medir("carregar_dados"):
+        return armazenamento.carregar(ARQUIVO_DB)
 
 def salvar_registro(novo_dado):
-    df = carregar_dados()
-    if 'Data_DT' in df.columns:
-        df = df.drop(columns=['Data_DT'])
-    novo_df = pd.DataFrame([novo_dado])
-    df_final = pd.concat([df, novo_df], ignore_index=True)
-    df_final.to_csv(ARQUIVO_DB, index=False)
-    return df_final
-
-def sobrescrever_banco(df_novo):
-    if 'Data_DT' in df_novo.columns:
-        df_novo = df_novo.drop(columns=['Data_DT'])
-    df_novo.to_csv(ARQUIVO_DB, index=False)
+    # Só anexa uma linha ao diário do usuário; a compactação roda depois
+    with diagnostico.medir("salvar_registro"):
+        armazenamento.anexar(ARQUIVO_DB, novo_dado)
 
 if 'resultado_tela' not in st.session_state:
     st.session_state.resultado_tela = None
 
-# --- FUNÇÃO: GERAR PDF ---
-def gerar_pdf(df_historico, filtro_msg="Geral"):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", 'B', 16)
-    pdf.cell(200, 10, "Relatorio de Controle Glicemico", ln=True, align='C')
-    pdf.set_font("Arial", 'I', 10)
-    pdf.cell(200, 10, f"Paciente: {usuario_atual.capitalize()} | Filtro: {filtro_msg}", ln=True, align='C')
-    pdf.set_font("Arial", size=10)
-    pdf.cell(200, 10, f"Gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M')}", ln=True, align='C')
-    pdf.ln(10)
-
-    if os.path.exists("grafico_temp.png"):
-        pdf.image("grafico_temp.png", x=10, y=50, w=190)
-        pdf.ln(100)
-    
-    pdf.set_font("Arial", 'B', 10)
-    pdf.cell(40, 10, "Data/Hora", 1)
-    pdf.cell(30, 10, "Glicemia", 1)
-    pdf.cell(30, 10, "Carbos", 1)
-    pdf.cell(30, 10, "ICR", 1)
-    pdf.cell(30, 10, "Dose", 1)
-    pdf.ln()
-    
-    pdf.set_font("Arial", size=10)
-    for index, row in df_historico.iterrows():
-        pdf.cell(40, 10, str(row['Data']), 1)
-        pdf.cell(30, 10, str(row['Glicemia']), 1)
-        pdf.cell(30, 10, str(row['Carbos']), 1)
-        pdf.cell(30, 10, str(row['ICR']), 1)
-        pdf.cell(30, 10, str(row['Dose']), 1)
-        pdf.ln()
-        
-    pdf.output("relatorio_final.pdf")
-
 # --- INTERFACE PRINCIPAL ---
 st.title(f"💉 Olá, {usuario_atual.capitalize()}!")
 
@@ -347,14 +283,7 @@ if st.button("CALCULAR E REGISTRAR", type="primary", use_container_width=True):
     if glicemia == 0 and carbos == 0:
         st.warning("⚠️ Digite a Glicemia ou os Carboidratos.")
     else:
-        if glicemia > ALVO:
-            correcao = (glicemia - ALVO) / FATOR_SENSIBILIDADE
-        else:
-            correcao = 0
-        
-        refeicao = carbos / icr
-        dose_total = correcao + refeicao
-        dose_final = round(dose_total)
+        resultado = calcular_dose(glicemia, carbos, icr)
         
         data_str = data_final_para_salvar.strftime("%d/%m/%Y %H:%M")
         novo_registro = {
@@ -362,18 +291,12 @@ if st.button("CALCULAR E REGISTRAR", type="primary", use_container_width=True):
             "Glicemia": glicemia,
             "Carbos": carbos,
             "ICR": icr,
-            "Dose": dose_final
+            "Dose": resultado["dose_final"]
         }
         
         salvar_registro(novo_registro)
         
-        st.session_state.resultado_tela = {
-            "glicemia": glicemia,
-            "dose_final": dose_final,
-            "correcao": correcao,
-            "refeicao": refeicao,
-            "dose_total": dose_total
-        }
+        st.session_state.resultado_tela = resultado
         
         st.rerun()
 
@@ -383,7 +306,7 @@ if st.session_state.resultado_tela is not None:
     
     st.markdown("---")
     
-    if res["glicemia"] < 70 and res["glicemia"] > 0:
+    if eh_hipoglicemia(res["glicemia"]):
         st.error("⚠️ HIPOGLICEMIA! Não aplique insulina. Coma 15g de açúcar.")
     else:
         st.success(f"## Dose Recomendada: {res['dose_final']} Unidades")
@@ -404,49 +327,109 @@ df = carregar_dados()
 
 st.write("⬇️ **1º Passo: Salvar no Celular**")
 if not df.empty:
-    csv = df.to_csv(index=False).encode('utf-8')
+    import backup
+    estado_backup = backup.ler_estado(ARQUIVO_DB)
+    novos_backup = backup.contar_novos(df, ARQUIVO_DB, estado_backup)
+    col_bk1, col_bk2 = st.columns(2)
+    formato_backup = col_bk1.selectbox("Formato", list(backup.FORMATOS), format_func=lambda f: {"csv": "CSV", "gzip": "CSV comprimido (.gz)", "zip": "ZIP"}[f])
+    opcoes_backup = ["Completo"] + ([f"Só os novos ({novos_backup})"] if estado_backup["cadeia"] else [])
+    incremental = col_bk2.radio("O que salvar?", opcoes_backup, horizontal=True) != "Completo"
+
+    # O arquivo só é montado no clique e fica em cache até os dados mudarem
+    chave_backup = (ARQUIVO_DB, formato_backup, incremental, estado_backup["cadeia"], estado_backup["sequencia"], armazenamento.versao(ARQUIVO_DB))
+    def montar_backup(formato=formato_backup, incremental=incremental, chave=chave_backup):
+        with diagnostico.medir("backup"):
+            return backup.backup_em_cache(chave, lambda: backup.gerar_backup(ARQUIVO_DB, usuario_atual, formato, incremental))
     st.download_button(
         label="Fazer Backup (Salvar)",
-        data=csv,
-        file_name=f"backup_insulina_{usuario_atual}.csv",
-        mime="text/csv",
+        data=montar_backup,
+        file_name=backup.nome_arquivo(usuario_atual, formato_backup, incremental, estado_backup["sequencia"] + 1),
+        mime=backup.FORMATOS[formato_backup][1],
+        on_click="ignore",
         type="primary",
+        disabled=incremental and novos_backup == 0,
         use_container_width=True
     )
+    if estado_backup["ultimo_backup"]:
+        st.caption(f"Último backup: {datetime.fromisoformat(estado_backup['ultimo_backup']).strftime('%d/%m/%Y %H:%M')} · {novos_backup} registro(s) novo(s) desde então")
 else:
     st.info("Sem dados para salvar.")
 
 st.write("") 
 st.write("📂 **2º Passo: Restaurar Antigo**")
-arquivo_upload = st.file_uploader(" ", type=["csv"], label_visibility="collapsed")
-if arquivo_upload is not None:
-    try:
-        df_restaurado = pd.read_csv(arquivo_upload)
-        sobrescrever_banco(df_restaurado)
-        st.success("✅ Backup Restaurado!")
-        st.rerun()
-    except:
-        st.error("Arquivo inválido.")
+if 'id_upload' not in st.session_state:
+    st.session_state.id_upload = 0
+if 'relatorio_importacao' not in st.session_state:
+    st.session_state.relatorio_importacao = None
+
+arquivos_upload = st.file_uploader(" ", type=["csv", "gz", "zip"], accept_multiple_files=True, label_visibility="collapsed", key=f"upload_{st.session_state.id_upload}")
+if arquivos_upload:
+    modo_importacao = st.radio(
+        "Como restaurar?",
+        ["Juntar com o que já tenho", "Substituir tudo"],
+        horizontal=True,
+    )
+    if len(arquivos_upload) > 1:
+        st.caption("Vários arquivos: o backup completo entra primeiro (com a opção acima) e os incrementais são juntados em ordem.")
+    if st.button("📥 Restaurar Backup", type="primary"):
+        import backup
+        modo = "mesclar" if modo_importacao.startswith("Juntar") else "substituir"
+        try:
+            st.session_state.relatorio_importacao = backup.restaurar_cadeia(arquivos_upload, ARQUIVO_DB, modo)
+            st.session_state.id_upload += 1  # limpa o campo de upload
+            st.rerun()
+        except (ValueError, UnicodeDecodeError, pd.errors.ParserError, pd.errors.EmptyDataError) as erro:
+            st.error(f"Arquivo inválido: {erro}")
+
+if st.session_state.relatorio_importacao is not None:
+    rel = st.session_state.relatorio_importacao
+    st.success(f"✅ Backup Restaurado! {rel['aceitos']} registros importados.")
+    st.caption(
+        f"Lidos: {rel['lidos']} | Rejeitados: {rel['rejeitados']} | Duplicados: {rel['duplicados']} | "
+        f"{rel['linhas_por_segundo']:.0f} linhas/s"
+    )
+    if rel.get("recuperados"):
+        st.caption(f"♻️ {rel['recuperados']} registro(s) que tinham sido apagados voltaram ao histórico")
+    for aviso in rel.get("avisos", []):
+        st.warning(aviso)
+    for motivo, quantidade in rel["motivos"].items():
+        st.caption(f"⚠️ {motivo}: {quantidade}")
+    st.session_state.relatorio_importacao = None
+
+# --- RELATÓRIOS EM SEGUNDO PLANO ---
+# Uma fila de trabalho por processo do servidor (agendador.py), criada no primeiro uso
+@st.cache_resource
+def iniciar_agendador():
+    import agendador
+    fila = agendador.iniciar()
+    diagnostico.registrar_coletor("agendador", fila.metricas)
+    return fila
+
+fila_relatorios = None
 
 # --- ÁREA DE RELATÓRIOS AVANÇADOS ---
 st.write("---")
 st.subheader("📊 Relatórios Personalizados")
 
 if not df.empty:
-    try:
-        if 'Data_DT' not in df.columns:
-            df['Data_DT'] = pd.to_datetime(df['Data'], format="%d/%m/%Y %H:%M")
-        df = df.sort_values(by='Data_DT')
-    except:
-        pass
+    # Dependências pesadas (matplotlib, fpdf) só carregam quando há relatório para mostrar
+    with diagnostico.medir("importar_relatorios"):
+        import urllib.parse
+        import graficos
+        import relatorios
+        import resumos
+        import simulacao
+        import analise
+        import agendador
+        fila_relatorios = iniciar_agendador()
 
     st.write("🔎 **O que você deseja ver?**")
     
     col_filtro1, col_filtro2 = st.columns(2)
     
     with col_filtro1:
-        min_date = df['Data_DT'].min().date()
-        max_date = df['Data_DT'].max().date()
+        # Primeira e última data vêm do índice por data (sem varrer o histórico)
+        min_date, max_date = armazenamento.limites_datas(ARQUIVO_DB) or (datetime.now().date(),) * 2
         periodo = st.date_input("Período", value=(min_date, max_date), min_value=min_date, max_value=max_date, format="DD/MM/YYYY")
     
     with col_filtro2:
@@ -454,75 +437,144 @@ if not df.empty:
         metricas_selecionadas = st.multiselect("Indicadores", opcoes_metricas, default=["Glicemia"])
         if not metricas_selecionadas: metricas_selecionadas = opcoes_metricas
 
-    mask_data = (df['Data_DT'].dt.date >= periodo[0]) & (df['Data_DT'].dt.date <= periodo[1]) if isinstance(periodo, tuple) and len(periodo) == 2 else (df['Data_DT'].dt.date == periodo[0]) if isinstance(periodo, tuple) and len(periodo) == 1 else True
-    
+    # Um dia só (o usuário ainda está escolhendo o fim) ou período; vazio = tudo
     if isinstance(periodo, tuple) and len(periodo) == 2:
-        df_filtrado = df.loc[mask_data]
+        inicio_periodo, fim_periodo = periodo
     elif isinstance(periodo, tuple) and len(periodo) == 1:
-        df_filtrado = df[df['Data_DT'].dt.date == periodo[0]]
+        inicio_periodo = fim_periodo = periodo[0]
     else:
-        df_filtrado = df
+        inicio_periodo, fim_periodo = min_date, max_date
+    # Busca binária no índice por data: O(log n + registros do período).
+    # A versão é lida antes dos dados e é ela que entra nas chaves de cache desta área:
+    # se outra sessão gravar no meio, a chave fica velha (e refaz depois), nunca o
+    # contrário (resultado de dados velhos guardado com a versão nova).
+    versao_periodo = armazenamento.versao(ARQUIVO_DB)
+    df_filtrado = armazenamento.consultar_periodo(ARQUIVO_DB, inicio_periodo, fim_periodo)
 
     if not df_filtrado.empty:
         st.write(f"Exibindo **{len(df_filtrado)}** registros.")
         
-        fig, ax = plt.subplots(figsize=(8, 4))
-        if "Glicemia" in metricas_selecionadas:
-            ax.plot(df_filtrado['Data'], df_filtrado['Glicemia'], marker='o', label='Glicemia', color='blue')
-            ax.axhline(y=ALVO, color='red', linestyle='--', alpha=0.5, label='Alvo')
-        if "Carbos" in metricas_selecionadas:
-            ax.plot(df_filtrado['Data'], df_filtrado['Carbos'], marker='s', label='Carbos (g)', color='orange', linestyle='-.')
-        if "Dose" in metricas_selecionadas:
-            ax.plot(df_filtrado['Data'], df_filtrado['Dose'], marker='^', label='Dose (u)', color='green')
-
-        ax.set_title("Evolução no Período")
-        ax.grid(True, alpha=0.3)
-        ax.legend()
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        st.pyplot(fig)
-        plt.savefig("grafico_temp.png")
+        chave_grafico = (usuario_atual, inicio_periodo, fim_periodo, tuple(metricas_selecionadas), versao_periodo)
+        with diagnostico.medir("grafico"):
+            grafico_png = graficos.grafico_em_cache(
+                chave_grafico, lambda: graficos.renderizar_grafico(df_filtrado, metricas_selecionadas, ALVO)
+            )
+        st.image(grafico_png)
+
+        # Tempo no alvo, variabilidade e perfil por hora (em cache por período + versão dos dados)
+        with diagnostico.medir("analise"):
+            analise_periodo = analise.analisar(ARQUIVO_DB, inicio_periodo, fim_periodo)
+        indicadores = analise_periodo["metricas"]
+        agp_png = None
+        if indicadores["leituras"]:
+            st.write("🎯 **Controle Glicêmico**")
+            col_a1, col_a2, col_a3, col_a4, col_a5 = st.columns(5)
+            col_a1.metric("No alvo (70-180)", f"{indicadores['tir']:.0f}%")
+            col_a2.metric("Abaixo de 70", f"{indicadores['abaixo']:.0f}%")
+            col_a3.metric("Acima de 180", f"{indicadores['acima']:.0f}%")
+            col_a4.metric("Variação (CV)", f"{indicadores['cv']:.0f}%",
+                          "estável" if indicadores['cv'] <= analise.LIMITE_CV else "instável",
+                          delta_color="normal" if indicadores['cv'] <= analise.LIMITE_CV else "inverse")
+            col_a5.metric("GMI (A1c estimada)", f"{indicadores['gmi']:.1f}%")
+            with diagnostico.medir("grafico_agp"):
+                agp_png = graficos.grafico_em_cache(
+                    ("agp", usuario_atual, inicio_periodo, fim_periodo, versao_periodo),
+                    lambda: graficos.renderizar_agp(analise_periodo["agp"], analise.FAIXA_ALVO)
+                )
+            st.image(agp_png)
 
         st.write("📋 **Dados Detalhados**")
         
         cols_to_show = ["Data", "Glicemia", "Carbos", "ICR", "Dose"]
         cols_final = [c for c in cols_to_show if c in df_filtrado.columns]
-        
-        df_visual = df_filtrado[cols_final].copy()
-        df_visual["Excluir"] = False
+
+        # Só a página visível vai para o navegador (mais recentes primeiro). As marcações
+        # de "Excluir" ficam guardadas por ID e valem em todas as páginas.
+        if 'ids_excluir' not in st.session_state:
+            st.session_state.ids_excluir = set()
+        total_paginas = max(1, -(-len(df_filtrado) // REGISTROS_POR_PAGINA))
+        col_pag1, col_pag2 = st.columns([1, 2])
+        pagina_atual = col_pag1.number_input("Página", min_value=1, max_value=total_paginas, value=1, step=1)
+        col_pag2.caption(f"de {total_paginas} · {REGISTROS_POR_PAGINA} por página")
+        df_pagina, _ = armazenamento.consultar_pagina(ARQUIVO_DB, pagina_atual, REGISTROS_POR_PAGINA, inicio_periodo, fim_periodo)
+
+        # O ID fica no índice (escondido): identifica o registro mesmo com horários repetidos
+        df_visual = df_pagina.set_index("ID")[cols_final]
+        df_visual["Excluir"] = df_visual.index.isin(st.session_state.ids_excluir)
         
         df_editado = st.data_editor(
             df_visual,
             column_config={"Excluir": st.column_config.CheckboxColumn("Excluir?", default=False)},
+            disabled=cols_final,
             hide_index=True,
-            use_container_width=True
+            use_container_width=True,
+            # Página, período ou dados diferentes = tabela nova (as marcações vêm de ids_excluir)
+            key=f"tabela_{pagina_atual}_{hash((inicio_periodo, fim_periodo, versao_periodo))}"
         )
-        
+        marcados = df_editado.index[df_editado["Excluir"] == True]
+        st.session_state.ids_excluir.difference_update(df_editado.index)
+        st.session_state.ids_excluir.update(marcados)
+
+        if st.session_state.ids_excluir:
+            st.caption(f"{len(st.session_state.ids_excluir)} registro(s) marcado(s) para excluir")
         if st.button("🗑️ Apagar Linhas Selecionadas"):
-            linhas_excluir = df_editado[df_editado["Excluir"] == True]
-            if not linhas_excluir.empty:
-                datas_para_apagar = linhas_excluir['Data'].tolist()
-                df_original = carregar_dados()
-                df_limpo = df_original[~df_original['Data'].isin(datas_para_apagar)]
-                sobrescrever_banco(df_limpo)
+            if st.session_state.ids_excluir:
+                armazenamento.apagar(ARQUIVO_DB, list(st.session_state.ids_excluir))
+                st.session_state.ids_excluir = set()
                 st.success("Registros apagados!")
                 st.rerun()
 
+        with st.expander("🧪 Simulador: e se o ICR / Sensibilidade / Alvo fossem outros?"):
+            st.caption("Recalcula a dose de cada registro do período com outros parâmetros e compara com a dose registrada (diferença em unidades).")
+            col_sim1, col_sim2 = st.columns(2)
+            sens_sim = col_sim1.multiselect("Sensibilidades", [20, 25, 30, 35, 40, 45, 50, 60], default=[FATOR_SENSIBILIDADE])
+            alvos_sim = col_sim2.multiselect("Alvos", [80, 90, 100, 110, 120, 130, 140], default=[ALVO])
+            # O corpo do expander roda em todo rerun: a simulação só roda no botão, e o
+            # resultado continua na tela (do cache) enquanto período, dados e opções não mudarem
+            chave_simulacao = (usuario_atual, inicio_periodo, fim_periodo, versao_periodo,
+                               tuple(sens_sim), tuple(alvos_sim))
+            if st.button("▶️ Simular", disabled=not (sens_sim and alvos_sim)):
+                st.session_state.chave_simulacao = chave_simulacao
+            if sens_sim and alvos_sim and st.session_state.get("chave_simulacao") == chave_simulacao:
+                with diagnostico.medir("simulacao"):
+                    simulado = simulacao.simulacao_em_cache(
+                        chave_simulacao, lambda: simulacao.simular_parametros(df_filtrado, lista_opcoes, sens_sim, alvos_sim)
+                    )
+                st.dataframe(simulado.round(2), hide_index=True, use_container_width=True)
+                if len(sens_sim) == 1 and len(alvos_sim) == 1:
+                    st.line_chart(simulado.set_index("ICR")[["P5", "P25", "P50", "P75", "P95"]])
+
         st.write("### 📤 Exportar Relatório Personalizado")
         col_zap, col_pdf = st.columns(2)
         
-        gerar_pdf(df_filtrado, filtro_msg=f"Periodo: {periodo[0].strftime('%d/%m')} a {periodo[1].strftime('%d/%m') if isinstance(periodo, tuple) and len(periodo) > 1 else ''}")
-        with open("relatorio_final.pdf", "rb") as pdf_file:
-            col_pdf.download_button("📄 Baixar PDF (Filtrado)", pdf_file, "relatorio.pdf", "application/pdf", use_container_width=True)
+        # O PDF só é montado quando o botão é clicado, e fica em cache por período + versão dos dados
+        filtro_msg = f"Periodo: {inicio_periodo.strftime('%d/%m')} a {fim_periodo.strftime('%d/%m')}"
+        chave_pdf = chave_grafico
+        def montar_pdf(inicio=inicio_periodo, fim=fim_periodo, filtro_msg=filtro_msg, grafico_png=grafico_png,
+                       chave_pdf=chave_pdf, indicadores=indicadores, agp_png=agp_png):
+            # Os registros do PDF saem da mesma consulta por período, feita só no clique
+            def gerar():
+                df_pdf = armazenamento.consultar_periodo(ARQUIVO_DB, inicio, fim)
+                return relatorios.gerar_pdf(df_pdf, usuario_atual, filtro_msg, grafico_png,
+                                            analise.texto_metricas(indicadores), agp_png)
+            with diagnostico.medir("gerar_pdf"):
+                return relatorios.pdf_em_cache(chave_pdf, gerar)
+        col_pdf.download_button("📄 Baixar PDF (Filtrado)", montar_pdf, "relatorio.pdf", "application/pdf", on_click="ignore", use_container_width=True)
 
         if not df_filtrado.empty:
-            media_glic = df_filtrado['Glicemia'].mean()
-            total_dose = df_filtrado['Dose'].sum()
+            # Totais do período somando os resumos diários, sem varrer as leituras
+            resumo = resumos.resumo_periodo(ARQUIVO_DB, inicio_periodo, fim_periodo)
+            media_glic = f"{resumo['media_glicemia']:.0f}" if resumo["leituras"] else "sem leituras"
+            total_dose = resumo["total_dose"]
             msg_zap = (f"*RESUMO DO PERÍODO*\n"
-                       f"🗓️ {periodo[0].strftime('%d/%m')} até {periodo[1].strftime('%d/%m') if isinstance(periodo, tuple) and len(periodo) > 1 else ''}\n"
-                       f"🩸 Glicemia Média: {media_glic:.0f}\n"
+                       f"🗓️ {inicio_periodo.strftime('%d/%m')} até {fim_periodo.strftime('%d/%m')}\n"
+                       f"🩸 Glicemia Média: {media_glic}\n"
                        f"💉 Total Insulina: {total_dose} u\n"
-                       f"📝 Registros: {len(df_filtrado)}")
+                       f"📝 Registros: {resumo['registros']}")
+            if indicadores["leituras"]:
+                msg_zap += (f"\n🎯 No alvo (70-180): {indicadores['tir']:.0f}%"
+                            f"\n⬇️ Abaixo de 70: {indicadores['abaixo']:.0f}% | ⬆️ Acima de 180: {indicadores['acima']:.0f}%"
+                            f"\n📈 CV: {indicadores['cv']:.0f}% | GMI: {indicadores['gmi']:.1f}%")
             msg_encoded = urllib.parse.quote(msg_zap)
             link_zap = f"https://wa.me/?text={msg_encoded}"
             col_zap.link_button("💚 Resumo no WhatsApp", link_zap, use_container_width=True)
@@ -530,6 +582,23 @@ if not df.empty:
     else:
         st.info("Nenhum dado encontrado para este período.")
 
+    # Semanal e mensal já montados pelo agendador: o clique só lê o arquivo do disco
+    st.write("### 📅 Relatórios Prontos")
+    for col_pronto, tipo in zip(st.columns(len(agendador.PERIODOS)), agendador.PERIODOS):
+        rotulo = agendador.PERIODOS[tipo][1]
+        meta_pronto, em_dia = agendador.situacao(usuario_atual, tipo)
+        if not em_dia:
+            fila_relatorios.enfileirar(usuario_atual, tipo)
+        if meta_pronto is None:
+            col_pronto.button(f"⏳ {rotulo}: preparando...", disabled=True, key=f"pronto_{tipo}", use_container_width=True)
+            continue
+        col_pronto.download_button(
+            f"📄 {rotulo}", lambda tipo=tipo: agendador.ler_relatorio(usuario_atual, tipo), f"relatorio_{tipo}.pdf",
+            "application/pdf", on_click="ignore", key=f"pronto_{tipo}", use_container_width=True
+        )
+        gerado_em = datetime.fromisoformat(meta_pronto["gerado_em"]).strftime('%d/%m %H:%M')
+        col_pronto.caption(f"Gerado em {gerado_em}" + ("" if em_dia else " · atualizando com os dados novos"))
+
 else:
     st.info("Histórico vazio. Faça um cálculo ou recupere um backup.")
 
@@ -543,3 +612,34 @@ st.markdown(
     """,
     unsafe_allow_html=True
 )
+
+# --- DIAGNÓSTICO (OPCIONAL) ---
+resumo_rerun = diagnostico.finalizar_rerun()
+with st.sidebar:
+    st.write("---")
+    if st.checkbox("🩺 Diagnóstico de desempenho", key="mostrar_diagnostico"):
+        st.caption(f"Este rerun: **{resumo_rerun['total_s'] * 1000:.0f} ms**")
+        st.dataframe(
+            pd.DataFrame([
+                {"Trecho": "  " * t["nivel"] + t["trecho"], "ms": round(t["segundos"] * 1000, 1)}
+                for t in resumo_rerun["trechos"]
+            ]),
+            hide_index=True, use_container_width=True
+        )
+        st.caption("Acumulado do servidor")
+        st.dataframe(
+            pd.DataFrame([
+                {"Trecho": nome, "Vezes": a["contagem"], "Média ms": round(a["media_s"] * 1000, 1), "Máx ms": round(a["max_s"] * 1000, 1)}
+                for nome, a in sorted(diagnostico.agregados().items())
+            ]),
+            hide_index=True, use_container_width=True
+        )
+        st.caption("Cache de históricos")
+        st.json(armazenamento.estatisticas_cache())
+        if fila_relatorios is not None:
+            estado_fila = fila_relatorios.estado()
+            st.caption("Relatórios em segundo plano")
+            st.json({k: v for k, v in estado_fila.items() if k != "historico"})
+            if estado_fila["historico"]:
+                st.dataframe(pd.DataFrame(estado_fila["historico"]), hide_index=True, use_container_width=True)
+        st.download_button("Métricas (Prometheus)", diagnostico.texto_prometheus(), "metricas.prom", "text/plain", use_container_width=True)
@@ -0,0 +1,791 @@
+import os
+import io
+import time
+import secrets
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from travas import trava_arquivo
+
+# --- ARMAZENAMENTO DO HISTÓRICO (SNAPSHOT + DIÁRIO) ---
+# Cada usuário tem um snapshot "db_{usuario}.csv" e um diário "db_{usuario}.journal".
+# Um novo registro é só UMA linha anexada ao diário (com fsync), então salvar não
+# depende do tamanho do histórico. A compactação junta diário + snapshot num novo
+# snapshot, gravado em arquivo temporário e trocado por rename atômico.
+#
+# Cada registro tem um ID estável (coluna "ID"). Apagar não reescreve nada: os IDs
+# apagados são anexados a "db_{usuario}.lapides" e a leitura pula esses registros.
+# A compactação remove de vez os registros apagados; ela roda sozinha quando as
+# lápides passam de LIMITE_LAPIDES da base.
+#
+# Protocolo de compactação (seguro contra processo morto no meio):
+#   1. diário -> diário.compactando, lápides -> lápides.compactando
+#      (novas linhas e lápides vão para arquivos novos)
+#   2. grava snapshot.tmp, fsync, renomeia para snapshot.novo
+#   3. cria o marcador .compactacao     (ponto de confirmação)
+#   4. snapshot.novo -> snapshot, apaga os .compactando e o marcador
+# Na leitura, _recuperar() termina uma compactação confirmada ou descarta uma
+# que não chegou ao passo 3. Nenhum passo trunca o histórico.
+#
+# Formato do snapshot (variável de ambiente CALC_FORMATO_DB):
+#   "csv" (padrão): db_{usuario}.csv, como sempre foi.
+#   "parquet":      db_{usuario}.parquet, colunar e tipado, com Data_DT já em datetime
+#                   (carrega sem interpretar datas). Precisa do pyarrow. Um CSV antigo
+#                   é convertido na primeira leitura e guardado como .csv.convertido.
+# O diário continua em texto nos dois formatos. Backup e restauração seguem em CSV.
+#
+# Concorrência: toda leitura e escrita segura a trava do arquivo (travas.py), que vale
+# entre threads e entre processos (flock em "db_{usuario}.lock"). Registros que chegam
+# juntos de várias sessões do mesmo processo são gravados num único append + fsync
+# (group commit): quem chega enquanto um grupo está sendo gravado entra no próximo.
+
+COLUNAS_DADOS = ["Data", "Glicemia", "Carbos", "ICR", "Dose"]
+COLUNAS = COLUNAS_DADOS + ["ID"]
+FORMATO_DATA = "%d/%m/%Y %H:%M"
+
+FORMATO_DB = os.environ.get("CALC_FORMATO_DB", "csv").lower()
+
+# Compacta em segundo plano quando o diário passar deste tamanho
+LIMITE_DIARIO_BYTES = 256 * 1024
+# ... ou quando os registros apagados passarem desta fração do histórico
+LIMITE_LAPIDES = 0.2
+
+# Cache dos DataFrames já lidos (compartilhado por todas as sessões do processo)
+LIMITE_CACHE_BYTES = int(os.environ.get("CALC_CACHE_MB", "64")) * 1024 * 1024
+OCIOSIDADE_CACHE_SEGUNDOS = 30 * 60
+
+def _trava(arquivo_db):
+    return trava_arquivo(arquivo_db)
+
+
+# --- AVISO DE ALTERAÇÕES ---
+# Quem mantém dados derivados (ex.: resumos diários) se registra aqui e é chamado,
+# ainda dentro da trava, com ouvinte(evento, arquivo_db, versao_antes, versao_depois, linhas):
+#   "insercao"     linhas = DataFrame com os registros novos
+#   "remocao"      linhas = DataFrame com os registros apagados
+#   "compactacao"  mesmo conteúdo, arquivos novos (linhas = None)
+#   "substituicao" histórico inteiro trocado (linhas = None)
+_ouvintes = []
+
+def registrar_ouvinte(ouvinte):
+    if ouvinte not in _ouvintes:
+        _ouvintes.append(ouvinte)
+
+def _notificar(evento, arquivo_db, antes, depois, linhas=None):
+    for ouvinte in _ouvintes:
+        ouvinte(evento, arquivo_db, antes, depois, linhas)
+
+
+# --- NOMES DOS ARQUIVOS AUXILIARES ---
+def _raiz(arquivo_db):
+    return os.path.splitext(arquivo_db)[0]
+
+def caminho_snapshot(arquivo_db, formato=None):
+    extensao = ".parquet" if (formato or FORMATO_DB) == "parquet" else ".csv"
+    return _raiz(arquivo_db) + extensao
+
+def caminho_diario(arquivo_db):
+    return _raiz(arquivo_db) + ".journal"
+
+def _caminho_compactando(arquivo_db):
+    return caminho_diario(arquivo_db) + ".compactando"
+
+def caminho_lapides(arquivo_db):
+    return _raiz(arquivo_db) + ".lapides"
+
+def _caminho_lapides_compactando(arquivo_db):
+    return caminho_lapides(arquivo_db) + ".compactando"
+
+def _caminho_marcador(arquivo_db):
+    return _raiz(arquivo_db) + ".compactacao"
+
+
+# --- ESCRITA DURÁVEL ---
+def _fsync_diretorio(caminho):
+    diretorio = os.path.dirname(os.path.abspath(caminho))
+    try:
+        fd = os.open(diretorio, os.O_RDONLY)
+    except OSError:
+        return  # Windows não permite abrir diretório
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _gravar_atomico_com(caminho, escrever):
+    # escrever(f) recebe o arquivo temporário aberto em modo binário
+    tmp = caminho + ".tmp"
+    with open(tmp, "wb") as f:
+        escrever(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, caminho)
+    _fsync_diretorio(caminho)
+
+def _gravar_atomico(caminho, conteudo):
+    _gravar_atomico_com(caminho, lambda f: f.write(conteudo))
+
+def _remover(caminho):
+    try:
+        os.remove(caminho)
+    except FileNotFoundError:
+        pass
+
+def _remover_se_vazio(caminho):
+    try:
+        if os.path.getsize(caminho) == 0:
+            os.remove(caminho)
+    except FileNotFoundError:
+        pass
+
+
+# --- CACHE POR USUÁRIO ---
+# Chave: caminho do banco. Vale enquanto a assinatura (inode, mtime, tamanho) dos
+# arquivos do usuário não mudar. As escritas deste processo atualizam ou invalidam
+# a entrada explicitamente; escritas de outro processo mudam a assinatura.
+_cache = OrderedDict()
+_cache_guarda = threading.Lock()
+_cache_bytes = 0
+_cache_stats = {"acertos": 0, "falhas": 0, "despejos": 0, "invalidacoes": 0}
+
+def _assinatura(caminho):
+    try:
+        st = os.stat(caminho)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def versao(arquivo_db):
+    # Identifica o conteúdo atual do histórico; muda a cada escrita
+    return (
+        _assinatura(caminho_snapshot(arquivo_db)),
+        _assinatura(_caminho_compactando(arquivo_db)),
+        _assinatura(caminho_diario(arquivo_db)),
+        _assinatura(_caminho_lapides_compactando(arquivo_db)),
+        _assinatura(caminho_lapides(arquivo_db)),
+    )
+
+def _tamanho_df(df):
+    return int(df.memory_usage(deep=True).sum())
+
+def _cache_guardar(arquivo_db, assinatura, df):
+    global _cache_bytes
+    with _cache_guarda:
+        _cache_remover(arquivo_db)
+        tamanho = _tamanho_df(df)
+        _cache[arquivo_db] = {"versao": assinatura, "df": df, "cauda": [], "bytes": tamanho,
+                              "acesso": time.monotonic()}
+        _cache_bytes += tamanho
+        _cache_despejar()
+
+# Inserções não copiam o histórico em cache: as linhas novas ficam numa "cauda" e só
+# são juntadas ao DataFrame na próxima leitura (várias inserções seguidas = uma junção).
+# O tamanho é somado só com as linhas novas, e a ordem por data é estendida na junção
+# quando as novas vêm depois das antigas (o caso normal); senão é recalculada.
+def _cache_anexar(arquivo_db, antes, depois, novo):
+    global _cache_bytes
+    with _cache_guarda:
+        entrada = _cache.get(arquivo_db)
+        if entrada is None or entrada["versao"] != antes:
+            if _cache_remover(arquivo_db) is not None:
+                _cache_stats["invalidacoes"] += 1
+            return
+        tamanho = _tamanho_df(novo)
+        entrada["cauda"].append(novo)
+        entrada["versao"] = depois
+        entrada["bytes"] += tamanho
+        _cache_bytes += tamanho
+        _cache_despejar()
+
+def _cache_juntar_cauda(entrada):
+    partes = [p for p in [entrada["df"], *entrada["cauda"]] if not p.empty]
+    n_antes = len(entrada["df"])
+    if len(partes) > 1:
+        entrada["df"] = pd.concat(partes, ignore_index=True)
+    elif partes:
+        entrada["df"] = partes[0]
+    entrada["cauda"] = []
+    indice = entrada.pop("indice", None)
+    if indice is None or "Data_DT" not in entrada["df"].columns:
+        return
+    ordem, datas = indice
+    novas = entrada["df"]["Data_DT"].to_numpy()[n_antes:]
+    if len(novas) == 0:
+        entrada["indice"] = indice
+        return
+    em_ordem = not np.isnat(novas).any() and bool((novas[1:] >= novas[:-1]).all())
+    depois_das_antigas = len(datas) == 0 or (not np.isnat(datas[-1]) and novas[0] >= datas[-1])
+    if em_ordem and depois_das_antigas:
+        entrada["indice"] = (np.concatenate([ordem, np.arange(n_antes, len(entrada["df"]))]),
+                             np.concatenate([datas, novas]))
+
+def _cache_renomear(arquivo_db, antes, depois):
+    # Mesmo conteúdo com outra assinatura (compactação): mantém df, tamanho e índice
+    with _cache_guarda:
+        entrada = _cache.get(arquivo_db)
+        if entrada is None or entrada["versao"] != antes:
+            return False
+        entrada["versao"] = depois
+        return True
+
+def _cache_remover(arquivo_db):
+    global _cache_bytes
+    entrada = _cache.pop(arquivo_db, None)
+    if entrada is not None:
+        _cache_bytes -= entrada["bytes"]
+    return entrada
+
+def _cache_despejar():
+    # Tira usuários ociosos e, se ainda passar do limite, os menos usados recentemente
+    limite_ocioso = time.monotonic() - OCIOSIDADE_CACHE_SEGUNDOS
+    for chave in [k for k, e in _cache.items() if e["acesso"] < limite_ocioso]:
+        _cache_remover(chave)
+        _cache_stats["despejos"] += 1
+    while _cache_bytes > LIMITE_CACHE_BYTES and len(_cache) > 1:
+        _cache_remover(next(iter(_cache)))
+        _cache_stats["despejos"] += 1
+
+def _cache_obter(arquivo_db, assinatura):
+    with _cache_guarda:
+        entrada = _cache.get(arquivo_db)
+        if entrada is None or entrada["versao"] != assinatura:
+            _cache_stats["falhas"] += 1
+            return None
+        entrada["acesso"] = time.monotonic()
+        _cache.move_to_end(arquivo_db)
+        _cache_stats["acertos"] += 1
+        if entrada["cauda"]:
+            _cache_juntar_cauda(entrada)
+        return entrada["df"]
+
+def invalidar_cache(arquivo_db):
+    with _cache_guarda:
+        if _cache_remover(arquivo_db) is not None:
+            _cache_stats["invalidacoes"] += 1
+
+def estatisticas_cache():
+    with _cache_guarda:
+        return dict(_cache_stats, usuarios=len(_cache), bytes=_cache_bytes)
+
+
+# --- LEITURA ---
+def _linhas_completas(caminho):
+    # Um processo morto no meio do append pode deixar a última linha pela metade: ela é ignorada
+    if not os.path.exists(caminho):
+        return b""
+    with open(caminho, "rb") as f:
+        bruto = f.read()
+    fim = bruto.rfind(b"\n")
+    return bruto[:fim + 1] if fim >= 0 else b""
+
+def _com_datas(df):
+    if not df.empty:
+        try:
+            df['Data_DT'] = pd.to_datetime(df['Data'], format=FORMATO_DATA)
+        except:
+            pass
+    return df
+
+# --- IDS ---
+def novo_id():
+    # Hora em ns (hex, largura fixa) + sufixo aleatório: único e ordenável pela criação
+    return f"{time.time_ns():016x}{secrets.token_hex(4)}"
+
+def _com_ids(df):
+    if "ID" not in df.columns:
+        df["ID"] = None
+    faltando = df["ID"].isna()
+    if faltando.any():
+        df["ID"] = df["ID"].astype(object)
+        df.loc[faltando, "ID"] = [novo_id() for _ in range(int(faltando.sum()))]
+    return df
+
+def _ler_diario(caminho):
+    bruto = _linhas_completas(caminho)
+    if not bruto:
+        return None
+    # Linhas antigas (antes dos IDs) têm 5 campos: o ID vem vazio
+    return _com_datas(pd.read_csv(io.BytesIO(bruto), header=None, names=COLUNAS, dtype={"ID": str}))
+
+def _ler_lapides(*caminhos):
+    ids = set()
+    for caminho in caminhos:
+        ids.update(_linhas_completas(caminho).decode("utf-8").split())
+    return ids
+
+def _sem_apagados(df, lapides):
+    # Tira os apagados e as cópias de um mesmo ID (possíveis após uma compactação interrompida)
+    com_id = df["ID"].notna()
+    repetido = com_id & df["ID"].duplicated()
+    apagado = df["ID"].isin(lapides) if lapides else False
+    if repetido.any() or (lapides and apagado.any()):
+        df = df[~(repetido | apagado)].reset_index(drop=True)
+    return df
+
+def _ler_snapshot(arquivo_db, caminho=None, formato=None):
+    formato = formato or FORMATO_DB
+    snapshot = caminho or caminho_snapshot(arquivo_db, formato)
+    if not os.path.exists(snapshot):
+        return None
+    if formato == "parquet":
+        # Snapshots gravados em fluxo (substituir_em_lotes) vêm em float64
+        df = _inteiros_compactos(pd.read_parquet(snapshot))
+    else:
+        df = _com_datas(pd.read_csv(snapshot, dtype={"ID": str}))
+    if "ID" not in df.columns:
+        df["ID"] = None  # snapshot de antes dos IDs
+    return df
+
+def _recuperar(arquivo_db):
+    snapshot = caminho_snapshot(arquivo_db)
+    novo = snapshot + ".novo"
+    if os.path.exists(_caminho_marcador(arquivo_db)):
+        # Compactação confirmada: termina o serviço
+        if os.path.exists(novo):
+            os.replace(novo, snapshot)
+            _fsync_diretorio(snapshot)
+        _remover(_caminho_compactando(arquivo_db))
+        _remover(_caminho_lapides_compactando(arquivo_db))
+        _remover(_caminho_marcador(arquivo_db))
+    else:
+        # Compactação não confirmada: os .compactando continuam valendo (um vazio, como o
+        # que a substituição cria, não tem nada e sai junto com o .novo)
+        _remover(novo)
+        _remover_se_vazio(_caminho_compactando(arquivo_db))
+        _remover_se_vazio(_caminho_lapides_compactando(arquivo_db))
+    _remover(snapshot + ".tmp")
+    _remover(novo + ".tmp")
+    _remover(_caminho_marcador(arquivo_db) + ".tmp")
+
+def _juntar(partes):
+    partes = [p for p in partes if p is not None and not p.empty]
+    if not partes:
+        return pd.DataFrame(columns=COLUNAS)
+    if len(partes) == 1:
+        return partes[0]
+    return pd.concat(partes, ignore_index=True)
+
+def _ler_tudo(arquivo_db):
+    df = _juntar([
+        _ler_snapshot(arquivo_db),
+        _ler_diario(_caminho_compactando(arquivo_db)),
+        _ler_diario(caminho_diario(arquivo_db)),
+    ])
+    lapides = _ler_lapides(_caminho_lapides_compactando(arquivo_db), caminho_lapides(arquivo_db))
+    return _sem_apagados(df, lapides)
+
+def _preparar(arquivo_db):
+    _recuperar(arquivo_db)
+    if FORMATO_DB == "parquet" and not os.path.exists(caminho_snapshot(arquivo_db)):
+        if os.path.exists(caminho_snapshot(arquivo_db, "csv")):
+            converter_para_colunar(arquivo_db)
+
+def _carregar_sem_copia(arquivo_db):
+    # (DataFrame do cache, versão lida junto com ele). O DataFrame é só para leitura.
+    with _trava(arquivo_db):
+        _preparar(arquivo_db)
+        assinatura = versao(arquivo_db)
+        df = _cache_obter(arquivo_db, assinatura)
+        if df is None:
+            df = _ler_tudo(arquivo_db)
+            if df["ID"].isna().any():
+                # Histórico de antes dos IDs: a compactação grava um ID em cada registro
+                compactar(arquivo_db, forcar=True)
+                assinatura = versao(arquivo_db)
+                df = _ler_tudo(arquivo_db)
+            _cache_guardar(arquivo_db, assinatura, df)
+    return df, assinatura
+
+def carregar(arquivo_db):
+    # Cópia: quem chama pode adicionar colunas sem estragar o cache
+    return _carregar_sem_copia(arquivo_db)[0].copy()
+
+
+# --- CONSULTAS POR DATA ---
+# O snapshot é gravado em ordem de Data_DT e o diário quase sempre chega em ordem, então
+# o histórico já está (ou quase) ordenado. A ordem por data (argsort estável de Data_DT,
+# barato em dados já ordenados) é calculada uma vez por versão e guardada junto da
+# entrada do cache; cada consulta de período ou página é um searchsorted + uma fatia:
+# O(log n + k), sem criar um objeto date por linha.
+def _ordem_por_data(df):
+    datas = df["Data_DT"].to_numpy() if "Data_DT" in df.columns else np.array([], dtype="datetime64[ns]")
+    ordem = np.argsort(datas, kind="stable")  # NaT (data inválida) fica no fim
+    return ordem, datas[ordem]
+
+def _indice_por_data(arquivo_db):
+    df, assinatura = _carregar_sem_copia(arquivo_db)
+    with _cache_guarda:
+        entrada = _cache.get(arquivo_db)
+        if entrada is not None and entrada["versao"] == assinatura and "indice" in entrada:
+            return (df, *entrada["indice"])
+    indice = _ordem_por_data(df)
+    with _cache_guarda:
+        entrada = _cache.get(arquivo_db)
+        if entrada is not None and entrada["versao"] == assinatura:
+            entrada["indice"] = indice
+    return (df, *indice)
+
+def _faixa(datas_ordenadas, inicio, fim):
+    # Posições [lo, hi) dos registros com data entre inicio e fim (dias inclusivos)
+    lo = 0 if inicio is None else np.searchsorted(datas_ordenadas, np.datetime64(pd.Timestamp(inicio)), "left")
+    if fim is None:
+        hi = len(datas_ordenadas)
+    else:
+        hi = np.searchsorted(datas_ordenadas, np.datetime64(pd.Timestamp(fim) + pd.Timedelta(days=1)), "left")
+    return int(lo), int(hi)
+
+def consultar_periodo(arquivo_db, inicio=None, fim=None):
+    # Registros com data entre inicio e fim (dias inclusivos; None = sem limite), em ordem de tempo
+    df, ordem, datas = _indice_por_data(arquivo_db)
+    lo, hi = _faixa(datas, inicio, fim)
+    return df.iloc[ordem[lo:hi]].reset_index(drop=True)
+
+def _ler_sem_alterar(arquivo_db):
+    # O mesmo conteúdo de _ler_tudo depois de _preparar, sem escrever nada: uma
+    # compactação confirmada mas não terminada é lida do .novo (os .compactando já estão
+    # nele) e, no formato colunar, um snapshot ainda não convertido é lido do CSV.
+    confirmada = os.path.exists(_caminho_marcador(arquivo_db))
+    novo = caminho_snapshot(arquivo_db) + ".novo"
+    if confirmada and os.path.exists(novo):
+        snapshot = _ler_snapshot(arquivo_db, novo)
+    else:
+        snapshot = _ler_snapshot(arquivo_db)
+        if snapshot is None and FORMATO_DB == "parquet":
+            snapshot = _ler_snapshot(arquivo_db, formato="csv")
+    partes, lapides = [snapshot], [caminho_lapides(arquivo_db)]
+    if not confirmada:
+        partes.append(_ler_diario(_caminho_compactando(arquivo_db)))
+        lapides.append(_caminho_lapides_compactando(arquivo_db))
+    partes.append(_ler_diario(caminho_diario(arquivo_db)))
+    return _sem_apagados(_juntar(partes), _ler_lapides(*lapides))
+
+def consultar_periodo_sem_alterar(arquivo_db, inicio=None, fim=None):
+    # Como consultar_periodo, para quem só observa (painel da equipe clínica, outros
+    # processos): não termina compactação, não cria IDs, não converte o formato e não
+    # passa pelo cache. Cada chamada lê os arquivos.
+    with _trava(arquivo_db):
+        df = _ler_sem_alterar(arquivo_db)
+    ordem, datas = _ordem_por_data(df)
+    lo, hi = _faixa(datas, inicio, fim)
+    return df.iloc[ordem[lo:hi]].reset_index(drop=True)
+
+def limites_datas(arquivo_db):
+    # (primeiro dia, último dia) do histórico, ou None se não houver datas válidas
+    _, _, datas = _indice_por_data(arquivo_db)
+    validas = int(np.count_nonzero(~np.isnat(datas)))
+    if not validas:
+        return None
+    return pd.Timestamp(datas[0]).date(), pd.Timestamp(datas[validas - 1]).date()
+
+def consultar_pagina(arquivo_db, numero, por_pagina, inicio=None, fim=None):
+    # Devolve (página, total no período); página 1 = registros mais recentes
+    df, ordem, datas = _indice_por_data(arquivo_db)
+    lo, hi = _faixa(datas, inicio, fim)
+    topo = max(lo, hi - (numero - 1) * por_pagina)
+    posicoes = ordem[max(lo, topo - por_pagina):topo][::-1]
+    return df.iloc[posicoes].reset_index(drop=True), hi - lo
+
+
+# --- FORMATO COLUNAR ---
+def _inteiros_compactos(df):
+    # int16 quando todos os valores forem inteiros e couberem (sobra folga para contas
+    # como glicemia - alvo sem estourar); senão mantém o tipo numérico original
+    for coluna in ["Glicemia", "Carbos", "ICR", "Dose"]:
+        valores = pd.to_numeric(df[coluna], errors="coerce")
+        if valores.notna().all() and (valores % 1 == 0).all() and valores.abs().max() < 2 ** 15:
+            valores = valores.astype("int16")
+        df[coluna] = valores
+    return df
+
+def _tipar(df):
+    df = _inteiros_compactos(df.copy())
+    df["Data"] = df["Data"].astype(str)
+    df["ID"] = df["ID"].astype(str)
+    return df
+
+def _serializar(df, formato):
+    if formato == "parquet":
+        buffer = io.BytesIO()
+        colunas = COLUNAS + (["Data_DT"] if "Data_DT" in df.columns else [])
+        _tipar(df[colunas]).to_parquet(buffer, index=False)
+        return buffer.getvalue()
+    return df[COLUNAS].to_csv(index=False).encode("utf-8")
+
+def converter_para_colunar(arquivo_db):
+    # CSV -> Parquet. O CSV só sai do caminho depois que o Parquet estiver gravado.
+    csv = caminho_snapshot(arquivo_db, "csv")
+    with _trava(arquivo_db):
+        if not os.path.exists(csv):
+            return False
+        df = _com_ids(_com_datas(pd.read_csv(csv, dtype={"ID": str})))
+        _gravar_atomico(caminho_snapshot(arquivo_db, "parquet"), _serializar(df, "parquet"))
+        os.replace(csv, csv + ".convertido")
+        _fsync_diretorio(csv)
+    invalidar_cache(arquivo_db)
+    return True
+
+def _escrever_lotes(f, lotes, formato):
+    # Grava um snapshot lote a lote, sem juntar tudo na memória
+    if formato == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        # Esquema fixo (numéricos em float64): os lotes podem vir com tipos diferentes.
+        # A próxima compactação volta para os tipos compactos.
+        numericas = COLUNAS_DADOS[1:]
+        esquema = pa.schema([("Data", pa.string())] + [(c, pa.float64()) for c in numericas]
+                            + [("ID", pa.string()), ("Data_DT", pa.timestamp("us"))])
+        with pq.ParquetWriter(f, esquema) as escritor:
+            for lote in lotes:
+                lote = _com_datas(_com_ids(lote.copy())[COLUNAS])
+                tabela = pa.Table.from_pandas(lote.astype({c: "float64" for c in numericas}),
+                                              schema=esquema, preserve_index=False)
+                escritor.write_table(tabela)
+        return
+    f.write((",".join(COLUNAS) + "\n").encode("utf-8"))
+    for lote in lotes:
+        f.write(_com_ids(lote.copy())[COLUNAS].to_csv(header=False, index=False).encode("utf-8"))
+
+# --- ESCRITA ---
+def _em_ordem(df):
+    # Snapshot em ordem de tempo (estável: registros no mesmo minuto mantêm a ordem de entrada)
+    if "Data_DT" in df.columns and not df["Data_DT"].is_monotonic_increasing:
+        df = df.sort_values("Data_DT", kind="stable").reset_index(drop=True)
+    return df
+
+def _linhas_csv(df):
+    return df[COLUNAS].to_csv(header=False, index=False).encode("utf-8")
+
+def _descartar_linha_parcial(f):
+    # Corta a linha pela metade deixada por um append interrompido, senão a próxima gruda nela
+    tamanho = f.seek(0, os.SEEK_END)
+    if tamanho == 0:
+        return
+    f.seek(tamanho - 1)
+    if f.read(1) == b"\n":
+        return
+    f.seek(0)
+    bruto = f.read()
+    f.truncate(bruto.rfind(b"\n") + 1)
+    f.seek(0, os.SEEK_END)
+
+def anexar(arquivo_db, registro):
+    # Devolve o ID do registro gravado
+    df_novo = _com_ids(pd.DataFrame([registro]))
+    anexar_lote(arquivo_db, df_novo)
+    return df_novo["ID"].iloc[0]
+
+# --- GROUP COMMIT ---
+_filas = {}
+_filas_guarda = threading.Lock()
+
+class _FilaGravacao:
+    def __init__(self):
+        self.condicao = threading.Condition()
+        self.pendentes = []
+        self.gravando = False
+
+def _fila(arquivo_db):
+    with _filas_guarda:
+        if arquivo_db not in _filas:
+            _filas[arquivo_db] = _FilaGravacao()
+        return _filas[arquivo_db]
+
+def anexar_lote(arquivo_db, df_novos, compactar_se_grande=True):
+    # Entra na fila do arquivo. Se ninguém estiver gravando, esta thread vira a "líder":
+    # grava o seu pedido junto com todos os que estiverem esperando e acorda os outros.
+    if df_novos.empty:
+        return
+    pedido = {"linhas": _com_ids(df_novos.copy()), "pronto": False, "erro": None, "tamanho": 0}
+    fila = _fila(arquivo_db)
+    grupo = None
+    with fila.condicao:
+        fila.pendentes.append(pedido)
+        while fila.gravando and not pedido["pronto"]:
+            fila.condicao.wait()
+        if not pedido["pronto"]:
+            fila.gravando = True
+            grupo, fila.pendentes = fila.pendentes, []
+    if grupo is not None:
+        try:
+            tamanho = _gravar_grupo(arquivo_db, [p["linhas"] for p in grupo])
+        except BaseException as erro:
+            for p in grupo:
+                p["erro"] = erro
+            tamanho = 0
+        with fila.condicao:
+            for p in grupo:
+                p["pronto"] = True
+                p["tamanho"] = tamanho
+            fila.gravando = False
+            fila.condicao.notify_all()
+    if pedido["erro"] is not None:
+        raise pedido["erro"]
+    if compactar_se_grande and pedido["tamanho"] > LIMITE_DIARIO_BYTES:
+        compactar_em_segundo_plano(arquivo_db)
+
+def _gravar_grupo(arquivo_db, lotes):
+    # Vários registros num único append + fsync; devolve o tamanho do diário
+    df_novos = lotes[0] if len(lotes) == 1 else pd.concat(lotes, ignore_index=True)
+    linhas = _linhas_csv(df_novos)
+    with _trava(arquivo_db):
+        antes = versao(arquivo_db)
+        with open(caminho_diario(arquivo_db), "a+b") as f:
+            _descartar_linha_parcial(f)
+            f.write(linhas)
+            f.flush()
+            os.fsync(f.fileno())
+        tamanho = os.path.getsize(caminho_diario(arquivo_db))
+        # Se o cache estava em dia, só acrescenta as linhas novas em vez de reler tudo
+        novo = _com_datas(df_novos[COLUNAS].reset_index(drop=True))
+        depois = versao(arquivo_db)
+        _cache_anexar(arquivo_db, antes, depois, novo)
+        _notificar("insercao", arquivo_db, antes, depois, novo)
+    return tamanho
+
+def _trocar_snapshot(arquivo_db, df_novo=None, lotes=None):
+    # Passos 2 a 4 do protocolo. Quem chama já segura a trava e já moveu o diário.
+    novo = caminho_snapshot(arquivo_db) + ".novo"
+    if lotes is None:
+        _gravar_atomico(novo, _serializar(df_novo, FORMATO_DB))
+    else:
+        _gravar_atomico_com(novo, lambda f: _escrever_lotes(f, lotes, FORMATO_DB))
+    _gravar_atomico(_caminho_marcador(arquivo_db), b"ok\n")
+    _recuperar(arquivo_db)
+
+def _mover_para_compactando(origem, destino):
+    # Passo 1 para um arquivo. Se sobrou um .compactando de uma tentativa abortada, o
+    # arquivo atual é acrescentado a ele: assim tudo que existia antes da compactação é
+    # absorvido junto (uma lápide nunca fica separada do registro que ela apaga). Se o
+    # processo morrer entre o acréscimo e a remoção, as linhas repetidas têm o mesmo ID
+    # e a leitura descarta a cópia.
+    if not os.path.exists(origem):
+        return
+    if not os.path.exists(destino):
+        os.replace(origem, destino)
+    else:
+        with open(destino, "a+b") as f:
+            _descartar_linha_parcial(f)
+            f.write(_linhas_completas(origem))
+            f.flush()
+            os.fsync(f.fileno())
+        os.remove(origem)
+    _fsync_diretorio(destino)
+
+def _separar_diario(arquivo_db):
+    _mover_para_compactando(caminho_diario(arquivo_db), _caminho_compactando(arquivo_db))
+    _mover_para_compactando(caminho_lapides(arquivo_db), _caminho_lapides_compactando(arquivo_db))
+
+def compactar(arquivo_db, forcar=False):
+    # forcar=True reescreve o snapshot mesmo sem diário/lápides (ex.: para gravar IDs)
+    with _trava(arquivo_db):
+        _preparar(arquivo_db)
+        antes = versao(arquivo_db)
+        _separar_diario(arquivo_db)
+        pendente = os.path.exists(_caminho_compactando(arquivo_db)) or os.path.exists(_caminho_lapides_compactando(arquivo_db))
+        if not pendente and not forcar:
+            return
+        df = _juntar([_ler_snapshot(arquivo_db), _ler_diario(_caminho_compactando(arquivo_db))])
+        df = _sem_apagados(df, _ler_lapides(_caminho_lapides_compactando(arquivo_db)))
+        sem_id = df["ID"].isna().any()
+        _trocar_snapshot(arquivo_db, _em_ordem(_com_ids(df)))
+        # O conteúdo visível não mudou, só os arquivos: o cache continua valendo com a
+        # nova assinatura (a não ser que IDs tenham sido criados agora)
+        depois = versao(arquivo_db)
+        if sem_id or not _cache_renomear(arquivo_db, antes, depois):
+            invalidar_cache(arquivo_db)
+        _notificar("compactacao", arquivo_db, antes, depois)
+
+def compactar_em_segundo_plano(arquivo_db):
+    t = threading.Thread(target=compactar, args=(arquivo_db,), daemon=True)
+    t.start()
+    return t
+
+def _separar_tudo(arquivo_db):
+    # Passo 1 de uma substituição. Absorve um .compactando pendente antes, para que o
+    # diário inteiro seja movido; o novo conteúdo substitui o histórico todo, diário incluído.
+    _preparar(arquivo_db)
+    compactar(arquivo_db)
+    _separar_diario(arquivo_db)
+    if not os.path.exists(_caminho_compactando(arquivo_db)):
+        with open(_caminho_compactando(arquivo_db), "wb"):
+            pass
+
+def _trocar_snapshot_ou_desfazer(arquivo_db, df_novo=None, lotes=None):
+    # Substituição recusada ou com erro antes da confirmação: limpa na hora (sem esperar
+    # a próxima leitura) o .novo e o .compactando vazio, e o histórico antigo fica como estava
+    try:
+        _trocar_snapshot(arquivo_db, df_novo, lotes)
+    except BaseException:
+        _recuperar(arquivo_db)
+        invalidar_cache(arquivo_db)
+        raise
+
+def _sobrescrever(arquivo_db, df_novo):
+    if 'Data_DT' in df_novo.columns:
+        df_novo = df_novo.drop(columns=['Data_DT'])
+    df_novo = _em_ordem(_com_ids(_com_datas(df_novo.copy())))
+    with _trava(arquivo_db):
+        _separar_tudo(arquivo_db)
+        _trocar_snapshot_ou_desfazer(arquivo_db, df_novo)
+        invalidar_cache(arquivo_db)
+
+def substituir_em_lotes(arquivo_db, lotes):
+    # Como sobrescrever, mas recebe um iterável de DataFrames e grava em fluxo.
+    # Se algo falhar no meio, a substituição não é confirmada e o histórico antigo fica.
+    with _trava(arquivo_db):
+        _separar_tudo(arquivo_db)
+        _trocar_snapshot_ou_desfazer(arquivo_db, lotes=lotes)
+        invalidar_cache(arquivo_db)
+        _notificar("substituicao", arquivo_db, None, versao(arquivo_db))
+
+def sobrescrever(arquivo_db, df_novo):
+    with _trava(arquivo_db):
+        _sobrescrever(arquivo_db, df_novo)
+        _notificar("substituicao", arquivo_db, None, versao(arquivo_db))
+
+def ids_apagados(arquivo_db):
+    # IDs com lápide ainda não absorvida por uma compactação. Um registro com um desses
+    # IDs que for gravado de novo seria escondido pela lápide na próxima leitura do disco,
+    # então quem reimporta registros (restauração de backup) precisa dar um ID novo a ele.
+    with _trava(arquivo_db):
+        return _ler_lapides(_caminho_lapides_compactando(arquivo_db), caminho_lapides(arquivo_db))
+
+def apagar(arquivo_db, ids):
+    # Grava uma lápide por ID (custo proporcional ao que foi apagado, não ao histórico)
+    ids = [str(i) for i in ids]
+    if not ids:
+        return 0
+    with _trava(arquivo_db):
+        # Sem cópia: as fatias abaixo já são DataFrames novos, o do cache não é alterado
+        df, antes = _carregar_sem_copia(arquivo_db)
+        apagados = df["ID"].isin(ids)
+        if not apagados.any():
+            return 0
+        removidos = df[apagados]
+        with open(caminho_lapides(arquivo_db), "a+b") as f:
+            _descartar_linha_parcial(f)
+            f.write(("\n".join(removidos["ID"]) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        depois = versao(arquivo_db)
+        restantes = df[~apagados].reset_index(drop=True)
+        _cache_guardar(arquivo_db, depois, restantes)
+        _notificar("remocao", arquivo_db, antes, depois, removidos)
+        n_lapides = len(_ler_lapides(_caminho_lapides_compactando(arquivo_db), caminho_lapides(arquivo_db)))
+    if n_lapides > LIMITE_LAPIDES * (len(restantes) + n_lapides):
+        compactar_em_segundo_plano(arquivo_db)
+    return int(apagados.sum())
+
+
+# --- CONVERSÃO PELA LINHA DE COMANDO ---
+# CALC_FORMATO_DB=parquet python armazenamento.py db_maria.csv db_joao.csv
+if __name__ == "__main__":
+    import sys
+    if FORMATO_DB != "parquet":
+        sys.exit("Defina CALC_FORMATO_DB=parquet antes de converter (e ao rodar o app).")
+    for arquivo in sys.argv[1:]:
+        if converter_para_colunar(arquivo):
+            print(f"✅ {arquivo} -> {caminho_snapshot(arquivo, 'parquet')}")
+        else:
+            print(f"⚠️ {arquivo}: nada para converter")
@@ -0,0 +1,207 @@
+import io
+import os
+import json
+import gzip
+import zipfile
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import armazenamento
+import importacao
+from travas import trava_arquivo
+
+# --- BACKUP: SOB DEMANDA, COMPRIMIDO E INCREMENTAL ---
+# O arquivo só é montado quando alguém clica em baixar, e fica num cache pequeno
+# até os dados mudarem. Formatos: csv, gzip (.csv.gz) e zip.
+#
+# Todo backup começa com uma linha de manifesto e segue com o CSV de sempre:
+#   # manifesto {"tipo": "completo"|"incremental", "cadeia": "...", "sequencia": 0, 1, 2..., ...}
+# "completo" leva o histórico inteiro e começa uma cadeia nova; "incremental" leva os
+# registros cujo ID ainda não foi exportado nesta cadeia. Não dá para comparar IDs por
+# ordem: um registro juntado de outro backup mantém o ID (antigo) que tinha lá. Os IDs
+# exportados ficam em "db_{usuario}.backup.ids" (um por linha) e o estado da cadeia em
+# "db_{usuario}.backup.json". Apagados não entram no incremental: para refletir
+# remoções, faça um completo.
+#
+# Na restauração, vários arquivos formam uma cadeia: completos (e backups antigos, sem
+# manifesto) primeiro, depois os incrementais em ordem. O primeiro segue a opção da tela
+# (juntar ou substituir); os seguintes são sempre juntados. Incremental de outra cadeia
+# ou com sequência pulada gera aviso.
+
+FORMATOS = {
+    "csv": (".csv", "text/csv"),
+    "gzip": (".csv.gz", "application/gzip"),
+    "zip": (".zip", "application/zip"),
+}
+PREFIXO_MANIFESTO = b"# manifesto "
+MAX_BACKUPS_EM_CACHE = 16
+
+_cache_backup = OrderedDict()
+_cache_guarda = threading.Lock()
+
+
+# --- ESTADO DO ÚLTIMO BACKUP ---
+def caminho_estado(arquivo_db):
+    return os.path.splitext(arquivo_db)[0] + ".backup.json"
+
+def caminho_exportados(arquivo_db):
+    return os.path.splitext(arquivo_db)[0] + ".backup.ids"
+
+def ler_estado(arquivo_db):
+    try:
+        with open(caminho_estado(arquivo_db), encoding="utf-8") as f:
+            estado = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"cadeia": None, "sequencia": 0, "ultimo_backup": None}
+    # Estado de antes das cadeias (só "ultimo_id"): continua valendo como base
+    estado.setdefault("cadeia", "legado" if estado.get("ultimo_id") else None)
+    return estado
+
+def _gravar_texto(caminho, texto):
+    tmp = caminho + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(texto)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, caminho)
+
+def _gravar_estado(arquivo_db, estado):
+    _gravar_texto(caminho_estado(arquivo_db), json.dumps(estado))
+
+def _exportados(arquivo_db, df, estado):
+    try:
+        with open(caminho_exportados(arquivo_db), encoding="utf-8") as f:
+            return set(f.read().split())
+    except FileNotFoundError:
+        pass
+    if estado.get("ultimo_id"):
+        # Estado antigo, sem a lista: o que ele marcava como exportado era ID <= ultimo_id
+        return set(df.loc[df["ID"] <= estado["ultimo_id"], "ID"])
+    return set()
+
+def contar_novos(df, arquivo_db, estado):
+    if not estado["cadeia"] or df.empty:
+        return len(df)
+    return int((~df["ID"].isin(_exportados(arquivo_db, df, estado))).sum())
+
+
+# --- EXPORTAÇÃO ---
+def nome_arquivo(usuario, formato, incremental, sequencia):
+    sufixo = f"_inc{sequencia:03d}" if incremental else ""
+    return f"backup_insulina_{usuario}{sufixo}{FORMATOS[formato][0]}"
+
+def _comprimir(conteudo, formato, nome_csv):
+    if formato == "gzip":
+        return gzip.compress(conteudo, mtime=0)
+    if formato == "zip":
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr(nome_csv, conteudo)
+        return buffer.getvalue()
+    return conteudo
+
+def gerar_backup(arquivo_db, usuario, formato="csv", incremental=False):
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconhecido: {formato}")
+    # A trava do estado impede duas sessões de gerar o mesmo incremental ao mesmo tempo
+    with trava_arquivo(caminho_estado(arquivo_db)):
+        estado = ler_estado(arquivo_db)
+        df = armazenamento.carregar(arquivo_db)
+        incremental = incremental and bool(estado["cadeia"])
+        if incremental:
+            exportados = _exportados(arquivo_db, df, estado)
+            df = df[~df["ID"].isin(exportados)]
+            sequencia, cadeia = estado["sequencia"] + 1, estado["cadeia"]
+        else:
+            exportados = set()
+            sequencia, cadeia = 0, secrets.token_hex(6)
+        corpo = df[armazenamento.COLUNAS].to_csv(index=False).encode("utf-8")
+        gerado_em = datetime.now().isoformat(timespec="seconds")
+        manifesto = {
+            "tipo": "incremental" if incremental else "completo",
+            "usuario": usuario,
+            "gerado_em": gerado_em,
+            "cadeia": cadeia,
+            "sequencia": sequencia,
+            "registros": len(df),
+            "sha256": hashlib.sha256(corpo).hexdigest(),
+        }
+        conteudo = PREFIXO_MANIFESTO + json.dumps(manifesto).encode("utf-8") + b"\n" + corpo
+        exportados.update(df["ID"])
+        _gravar_texto(caminho_exportados(arquivo_db), "".join(f"{i}\n" for i in sorted(exportados)))
+        _gravar_estado(arquivo_db, {"cadeia": cadeia, "sequencia": sequencia, "ultimo_backup": gerado_em})
+    nome_csv = nome_arquivo(usuario, "csv", incremental, sequencia)
+    return _comprimir(conteudo, formato, nome_csv)
+
+def backup_em_cache(chave, gerar):
+    # gerar() só roda quando a chave não está no cache
+    with _cache_guarda:
+        if chave in _cache_backup:
+            _cache_backup.move_to_end(chave)
+            return _cache_backup[chave]
+    conteudo = gerar()
+    with _cache_guarda:
+        _cache_backup[chave] = conteudo
+        while len(_cache_backup) > MAX_BACKUPS_EM_CACHE:
+            _cache_backup.popitem(last=False)
+    return conteudo
+
+
+# --- RESTAURAÇÃO ---
+def abrir_backup(arquivo):
+    # Aceita csv, gzip ou zip (pelo conteúdo, não pela extensão). Devolve (manifesto ou None, CSV)
+    bruto = arquivo.getvalue() if hasattr(arquivo, "getvalue") else arquivo.read()
+    try:
+        if bruto[:2] == b"\x1f\x8b":
+            bruto = gzip.decompress(bruto)
+        elif bruto[:4] == b"PK\x03\x04":
+            with zipfile.ZipFile(io.BytesIO(bruto)) as z:
+                nomes = [n for n in z.namelist() if n.lower().endswith(".csv")]
+                if not nomes:
+                    raise ValueError("O zip não tem nenhum CSV.")
+                bruto = z.read(nomes[0])
+    except (OSError, EOFError, zipfile.BadZipFile) as erro:
+        raise ValueError(f"Arquivo comprimido danificado ({erro}).")
+    if not bruto.startswith(PREFIXO_MANIFESTO):
+        return None, io.BytesIO(bruto)  # backup antigo: só o CSV
+    linha, _, corpo = bruto.partition(b"\n")
+    manifesto = json.loads(linha[len(PREFIXO_MANIFESTO):])  # JSON inválido já é ValueError
+    if hashlib.sha256(corpo).hexdigest() != manifesto.get("sha256"):
+        raise ValueError("Backup corrompido (conteúdo não confere com o manifesto).")
+    return manifesto, io.BytesIO(corpo)
+
+def _ordem(item):
+    manifesto = item[1]
+    if manifesto is None:
+        return (0, "", 0)
+    return (0 if manifesto["tipo"] == "completo" else 1, manifesto["gerado_em"], manifesto["sequencia"])
+
+def _consecutivo(anterior, manifesto):
+    if "cadeia" in manifesto:
+        # Manifesto de antes das cadeias: é a cadeia "legado" do estado migrado
+        return anterior.get("cadeia", "legado") == manifesto["cadeia"] and anterior["sequencia"] + 1 == manifesto["sequencia"]
+    return anterior.get("ate_id") == manifesto.get("desde_id")  # backups de antes das cadeias
+
+def restaurar_cadeia(arquivos, arquivo_db, modo_primeiro="mesclar"):
+    abertos = sorted(((getattr(a, "name", "backup"), *abrir_backup(a)) for a in arquivos), key=_ordem)
+    total = {"lidos": 0, "aceitos": 0, "rejeitados": 0, "duplicados": 0, "recuperados": 0, "motivos": {}, "segundos": 0,
+             "arquivos": len(abertos), "avisos": []}
+    tem_base, anterior = False, None
+    for i, (nome, manifesto, csv) in enumerate(abertos):
+        if manifesto is not None and manifesto["tipo"] == "incremental":
+            if not tem_base:
+                total["avisos"].append(f"{nome}: incremental sem o backup completo antes dele.")
+            elif anterior is not None and not _consecutivo(anterior, manifesto):
+                total["avisos"].append(f"{nome}: falta algum backup entre este e o anterior.")
+        modo = modo_primeiro if i == 0 else "mesclar"
+        relatorio = importacao.importar_backup(csv, arquivo_db, modo)
+        for campo in ("lidos", "aceitos", "rejeitados", "duplicados", "recuperados", "segundos"):
+            total[campo] += relatorio[campo]
+        for motivo, n in relatorio["motivos"].items():
+            total["motivos"][motivo] = total["motivos"].get(motivo, 0) + n
+        tem_base = True
+        anterior = manifesto  # backup antigo (None): não dá para conferir o seguinte
+    total["linhas_por_segundo"] = total["lidos"] / total["segundos"] if total["segundos"] else 0
+    return total
@@ -0,0 +1,91 @@
+import io
+import os
+import sys
+import json
+import argparse
+import tempfile
+
+# --- CADEIA DE BACKUPS: COMPLETO + INCREMENTAIS ---
+# Confere que a cadeia não perde registros quando entram registros com ID antigo depois
+# do último backup (o caso comum: juntar um backup de outro aparelho, que mantém os IDs
+# de lá) e que um incremental pulado na restauração gera aviso.
+#   1. paciente com 1 registro -> backup completo
+#   2. junta 1 registro de outro backup (ID mais antigo) e grava 1 registro novo
+#   3. incremental: tem que levar os 2; restaurar [completo, incremental] devolve os 3
+# Uso: python benchmarks/cadeia_backup.py [--json]
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def _registro(data, glicemia):
+    return {"Data": data, "Glicemia": glicemia, "Carbos": 30, "ICR": 10, "Dose": 3}
+
+def _arquivo(conteudo, nome):
+    arquivo = io.BytesIO(conteudo)
+    arquivo.name = nome
+    return arquivo
+
+def _verificar():
+    import armazenamento
+    import backup
+
+    # Criado primeiro: o ID dele é menor que o de qualquer registro do paciente
+    armazenamento.anexar("db_outro.csv", _registro("01/01/2024 08:00", 110))
+    de_outro = backup.gerar_backup("db_outro.csv", "outro")
+
+    db = "db_paciente.csv"
+    armazenamento.anexar(db, _registro("02/01/2024 08:00", 120))
+    completo = backup.gerar_backup(db, "paciente")
+    backup.restaurar_cadeia([_arquivo(de_outro, "outro.csv")], db, "mesclar")
+    armazenamento.anexar(db, _registro("03/01/2024 08:00", 130))
+
+    df = armazenamento.carregar(db)
+    novos = backup.contar_novos(df, db, backup.ler_estado(db))
+    incremental = backup.gerar_backup(db, "paciente", incremental=True)
+    relatorio = backup.restaurar_cadeia(
+        [_arquivo(completo, "completo.csv"), _arquivo(incremental, "inc001.csv")], "db_restaurado.csv", "substituir")
+    restaurados = set(armazenamento.carregar("db_restaurado.csv")["ID"])
+
+    # Um incremental a mais, restaurado sem o anterior: a cadeia tem um buraco
+    armazenamento.anexar(db, _registro("04/01/2024 08:00", 140))
+    pulado = backup.gerar_backup(db, "paciente", incremental=True)
+    com_buraco = backup.restaurar_cadeia(
+        [_arquivo(completo, "completo.csv"), _arquivo(pulado, "inc002.csv")], "db_buraco.csv", "substituir")
+
+    return {
+        "registros": len(df),
+        "novos_contados": novos,
+        "restaurados": len(restaurados),
+        "faltando": len(set(df["ID"]) - restaurados),
+        "avisos_cadeia_ok": relatorio["avisos"],
+        "avisos_cadeia_com_buraco": com_buraco["avisos"],
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Confere a cadeia de backups completo + incrementais.")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    args = parser.parse_args(argv)
+
+    inicial = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="cadeia_backup_") as diretorio:
+        os.chdir(diretorio)
+        try:
+            resultado = _verificar()
+        finally:
+            os.chdir(inicial)
+    falhou = (resultado["novos_contados"] != 2 or resultado["restaurados"] != resultado["registros"]
+              or resultado["faltando"] or resultado["avisos_cadeia_ok"] or not resultado["avisos_cadeia_com_buraco"])
+
+    if args.json:
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    else:
+        print(f"incremental depois de juntar: {resultado['novos_contados']} novos contados (esperado 2)")
+        print(f"restauração completo + incremental: {resultado['restaurados']}/{resultado['registros']} registros, "
+              f"avisos: {resultado['avisos_cadeia_ok'] or 'nenhum'}")
+        print(f"incremental pulado: avisos: {resultado['avisos_cadeia_com_buraco'] or 'nenhum'}")
+        print("❌ FALHOU" if falhou else "✅ OK")
+    return 1 if falhou else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import tracemalloc
+from datetime import timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+# --- DESEMPENHO DOS CAMINHOS DO APP POR TAMANHO DE HISTÓRICO ---
+# Para cada tamanho gera um histórico sintético (historico_sintetico.py), grava como
+# um usuário de verdade num diretório temporário e mede, sem navegador:
+#   carregar_frio    carregar_dados() com o cache vazio (leitura do disco)
+#   carregar_cache   carregar_dados() com o cache em dia
+#   mascara_periodo  filtro de período da tela de relatórios (últimos 30 dias), hoje
+#                    armazenamento.consultar_periodo (o nome fica para comparar com bases antigas)
+#   grafico          gráfico do período padrão (histórico inteiro)
+#   analise          tempo no alvo, CV, GMI e percentis por hora do histórico inteiro (sem cache)
+#   pagina_tabela    uma página (50 registros) da tabela de dados detalhados
+#   gerar_pdf        PDF dos últimos 30 dias, com gráfico
+#   gerar_pdf_tudo   PDF do histórico inteiro (só até --limite-pdf registros)
+#   backup_csv       backup completo em CSV (o que o botão de backup gera no clique)
+#   backup_gzip      o mesmo, comprimido
+#   salvar_registro  salvar_registro() de uma leitura nova
+# Tempo: mediana e mínimo de --repeticoes. Memória: pico do tracemalloc numa execução
+# separada (o tracemalloc deixa tudo mais lento, então não entra no tempo).
+#
+# Uso:
+#   python benchmarks/desempenho.py --tamanhos 1000 10000 100000 1000000 --saida base.json
+#   python benchmarks/desempenho.py --saida novo.json --comparar base.json
+# Com --comparar, sai com código 1 se alguma etapa ficou mais de --tolerancia mais lenta
+# (e pelo menos --folga-ms mais lenta, para não acusar ruído em etapas de milissegundos).
+
+TAMANHOS_PADRAO = [1000, 10000, 100000]
+DIAS_PERIODO = 30
+METRICAS = ["Glicemia"]
+
+
+def _medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    tracemalloc.start()
+    try:
+        funcao()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"mediana_s": statistics.median(tempos), "min_s": min(tempos), "pico_mb": pico / 2 ** 20}
+
+def _etapas(arquivo_db, limite_pdf):
+    import pandas as pd
+    import analise
+    import armazenamento
+    import backup
+    import graficos
+    import relatorios
+    from calculo import ALVO
+
+    df = armazenamento.carregar(arquivo_db)
+    fim = armazenamento.limites_datas(arquivo_db)[1]
+    periodo = (fim - timedelta(days=DIAS_PERIODO - 1), fim)
+
+    def carregar_frio():
+        armazenamento.invalidar_cache(arquivo_db)
+        armazenamento.carregar(arquivo_db)
+
+    def mascara_periodo():
+        # Mesma consulta da tela de relatórios e do PDF
+        return armazenamento.consultar_periodo(arquivo_db, *periodo)
+
+    df_periodo = mascara_periodo()
+    grafico_periodo = graficos.renderizar_grafico(df_periodo, METRICAS, ALVO)
+    etapas = {
+        "carregar_frio": carregar_frio,
+        "carregar_cache": lambda: armazenamento.carregar(arquivo_db),
+        "mascara_periodo": mascara_periodo,
+        "grafico": lambda: graficos.renderizar_grafico(df, METRICAS, ALVO),
+        "analise": lambda: analise.analisar_df(df),
+        "pagina_tabela": lambda: armazenamento.consultar_pagina(arquivo_db, 2, 50, *periodo),
+        "gerar_pdf": lambda: relatorios.gerar_pdf(df_periodo, "benchmark", "30 dias", grafico_periodo),
+    }
+    if len(df) <= limite_pdf:
+        etapas["gerar_pdf_tudo"] = lambda: relatorios.gerar_pdf(df, "benchmark", "Geral", grafico_periodo)
+    etapas["backup_csv"] = lambda: backup.gerar_backup(arquivo_db, "benchmark", "csv")
+    etapas["backup_gzip"] = lambda: backup.gerar_backup(arquivo_db, "benchmark", "gzip")
+
+    # Por último: cada execução grava um registro novo
+    proximo = [pd.Timestamp(df['Data_DT'].max())]
+    def salvar_registro():
+        proximo[0] += pd.Timedelta(minutes=1)
+        armazenamento.anexar(arquivo_db, {"Data": proximo[0].strftime(armazenamento.FORMATO_DATA),
+                                          "Glicemia": 150, "Carbos": 40, "ICR": 10, "Dose": 5})
+    etapas["salvar_registro"] = salvar_registro
+    return etapas
+
+def medir_tamanho(n, repeticoes, limite_pdf, semente):
+    import armazenamento
+    from historico_sintetico import gerar_historico
+
+    diretorio = tempfile.mkdtemp(prefix="desempenho_")
+    anterior = os.getcwd()
+    os.chdir(diretorio)
+    try:
+        arquivo_db = "db_benchmark.csv"
+        inicio = time.perf_counter()
+        armazenamento.sobrescrever(arquivo_db, gerar_historico(n, semente))
+        resultado = {"preparo_s": time.perf_counter() - inicio, "etapas": {}}
+        for nome, funcao in _etapas(arquivo_db, limite_pdf).items():
+            resultado["etapas"][nome] = _medir(funcao, repeticoes)
+        armazenamento.invalidar_cache(arquivo_db)
+        return resultado
+    finally:
+        os.chdir(anterior)
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+def comparar(atual, base, tolerancia, folga_ms):
+    regressoes = []
+    for tamanho, r in atual["tamanhos"].items():
+        etapas_base = base.get("tamanhos", {}).get(tamanho, {}).get("etapas", {})
+        for etapa, medida in r["etapas"].items():
+            if etapa not in etapas_base:
+                continue
+            antes, agora = etapas_base[etapa]["mediana_s"], medida["mediana_s"]
+            if agora > antes * (1 + tolerancia) and (agora - antes) * 1000 > folga_ms:
+                regressoes.append({"tamanho": int(tamanho), "etapa": etapa, "antes_s": antes, "agora_s": agora,
+                                   "razao": agora / antes if antes else float("inf")})
+    return regressoes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede os caminhos do app com históricos sintéticos.")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--formato", choices=["csv", "parquet"], default=os.environ.get("CALC_FORMATO_DB", "csv"))
+    parser.add_argument("--limite-pdf", type=int, default=20000,
+                        help="acima disso não mede o PDF do histórico inteiro")
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--saida", help="grava o resultado em JSON neste arquivo")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para checar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="fração aceita de piora (padrão 0.25)")
+    parser.add_argument("--folga-ms", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    # O formato precisa estar no ambiente antes de importar o armazenamento
+    os.environ["CALC_FORMATO_DB"] = args.formato
+    import numpy, pandas
+    resultado = {
+        "ambiente": {"python": platform.python_version(), "pandas": pandas.__version__,
+                     "numpy": numpy.__version__, "plataforma": platform.platform(),
+                     "formato_db": args.formato, "repeticoes": args.repeticoes},
+        "tamanhos": {},
+    }
+    for n in args.tamanhos:
+        resultado["tamanhos"][str(n)] = medir_tamanho(n, args.repeticoes, args.limite_pdf, args.semente)
+        if not args.json:
+            print(f"\n{n} registros (preparo {resultado['tamanhos'][str(n)]['preparo_s']:.1f}s)")
+            print(f"  {'etapa':<18} {'mediana':>10} {'mínimo':>10} {'pico mem':>10}")
+            for etapa, m in resultado["tamanhos"][str(n)]["etapas"].items():
+                print(f"  {etapa:<18} {m['mediana_s'] * 1000:>8.1f}ms {m['min_s'] * 1000:>8.1f}ms {m['pico_mb']:>8.1f}MB")
+
+    if args.comparar:
+        with open(args.comparar) as f:
+            resultado["regressoes"] = comparar(resultado, json.load(f), args.tolerancia, args.folga_ms)
+    if args.saida:
+        with open(args.saida, "w") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+    if args.json:
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    elif args.comparar:
+        if resultado["regressoes"]:
+            print(f"\n❌ {len(resultado['regressoes'])} regressão(ões) em relação a {args.comparar}:")
+            for r in resultado["regressoes"]:
+                print(f"  {r['tamanho']} registros, {r['etapa']}: {r['antes_s'] * 1000:.1f}ms -> "
+                      f"{r['agora_s'] * 1000:.1f}ms ({r['razao']:.2f}x)")
+        else:
+            print(f"\n✅ Nenhuma regressão em relação a {args.comparar}")
+    return 1 if resultado.get("regressoes") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
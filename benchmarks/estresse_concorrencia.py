@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+# --- ESTRESSE: VÁRIAS SESSÕES ESCREVENDO NO MESMO USUÁRIO ---
+# N processos x T threads gravam registros no mesmo db_estresse.csv ao mesmo tempo
+# (como paciente e cuidador em dois celulares, em vários workers). Alguns registros
+# são apagados no meio e o limite do diário é baixo para forçar compactações durante
+# a carga. No fim confere que nenhum registro se perdeu nem voltou depois de apagado.
+# Também cadastra usuários em paralelo no backend CSV e confere que todos ficaram.
+# Uso: python benchmarks/estresse_concorrencia.py [--processos 4] [--threads 4] [--registros 200] [--json]
+#      [--manter]  (não apaga a pasta temporária com o banco, o diário e os usuários no fim)
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+ARQUIVO_DB = "db_estresse.csv"
+
+
+def _escritor(diretorio, processo, n_threads, n_registros, limite_diario, fila):
+    os.chdir(diretorio)
+    import armazenamento
+    armazenamento.LIMITE_DIARIO_BYTES = limite_diario
+    gravados, apagados, erros = [], [], []
+
+    def sessao(thread):
+        rnd = random.Random(processo * 1000 + thread)
+        meus = []
+        try:
+            for i in range(n_registros):
+                minuto = (processo * n_threads + thread) * n_registros + i
+                registro = {
+                    "Data": f"{1 + minuto // 1440 % 28:02d}/01/2024 {minuto // 60 % 24:02d}:{minuto % 60:02d}",
+                    "Glicemia": rnd.randint(60, 300), "Carbos": rnd.randint(0, 120), "ICR": 10, "Dose": 0,
+                }
+                meus.append(armazenamento.anexar(ARQUIVO_DB, registro))
+                if rnd.random() < 0.05:
+                    alvo = meus.pop(rnd.randrange(len(meus)))
+                    armazenamento.apagar(ARQUIVO_DB, [alvo])
+                    apagados.append(alvo)
+        except Exception as erro:
+            erros.append(repr(erro))
+        gravados.extend(meus)
+
+    threads = [threading.Thread(target=sessao, args=(t,)) for t in range(n_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    fila.put({"gravados": gravados, "apagados": apagados, "erros": erros})
+
+def _cadastrador(diretorio, processo, n_usuarios, fila):
+    os.chdir(diretorio)
+    os.environ["CALC_BANCO_USUARIOS"] = "csv"
+    import usuarios
+    ok = [usuarios.cadastrar_usuario(f"p{processo}u{i}", "senha", "palavra")[0] for i in range(n_usuarios)]
+    fila.put(sum(ok))
+
+def _rodar(alvo, args_por_processo):
+    fila = multiprocessing.Queue()
+    processos = [multiprocessing.Process(target=alvo, args=(*a, fila)) for a in args_por_processo]
+    inicio = time.perf_counter()
+    for p in processos:
+        p.start()
+    resultados = [fila.get() for _ in processos]
+    for p in processos:
+        p.join()
+    return resultados, time.perf_counter() - inicio
+
+def _estressar(args, diretorio):
+    resultados, segundos = _rodar(_escritor, [
+        (diretorio, p, args.threads, args.registros, args.limite_diario) for p in range(args.processos)
+    ])
+    gravados = {i for r in resultados for i in r["gravados"]}
+    apagados = {i for r in resultados for i in r["apagados"]}
+    erros = [e for r in resultados for e in r["erros"]]
+
+    os.chdir(diretorio)
+    import armazenamento
+    armazenamento.compactar(ARQUIVO_DB)
+    armazenamento.invalidar_cache(ARQUIVO_DB)
+    no_disco = armazenamento.carregar(ARQUIVO_DB)["ID"]
+    ids_disco = set(no_disco)
+    escritas = len(gravados) + 2 * len(apagados)  # cada apagado foi gravado e depois apagado
+
+    cadastros, segundos_cadastro = _rodar(_cadastrador, [(diretorio, p, args.usuarios) for p in range(args.processos)])
+    from usuarios import BancoUsuariosCSV
+    no_csv = len(BancoUsuariosCSV().listar())
+
+    resultado = {
+        "processos": args.processos,
+        "sessoes": args.processos * args.threads,
+        "escritas": escritas,
+        "segundos": segundos,
+        "escritas_por_segundo": escritas / segundos,
+        "perdidos": len(gravados - ids_disco),
+        "ressuscitados": len(apagados & ids_disco),
+        "sobrando": len(ids_disco - gravados),
+        "repetidos": int(no_disco.duplicated().sum()),
+        "erros": erros,
+        "cadastros_esperados": args.processos * args.usuarios,
+        "cadastros_ok": sum(cadastros),
+        "cadastros_no_csv": no_csv,
+        "cadastros_por_segundo": sum(cadastros) / segundos_cadastro,
+    }
+    falhou = (resultado["perdidos"] or resultado["ressuscitados"] or resultado["sobrando"] or resultado["repetidos"]
+              or erros or no_csv != resultado["cadastros_esperados"])
+
+    if args.json:
+        print(json.dumps(resultado, indent=2))
+    else:
+        print(f"{resultado['sessoes']} sessões em {args.processos} processos: {escritas} escritas em "
+              f"{segundos:.2f}s ({resultado['escritas_por_segundo']:.0f}/s)")
+        print(f"  perdidos: {resultado['perdidos']}  ressuscitados: {resultado['ressuscitados']}  "
+              f"sobrando: {resultado['sobrando']}  repetidos: {resultado['repetidos']}  erros: {len(erros)}")
+        print(f"  cadastros CSV: {no_csv}/{resultado['cadastros_esperados']} "
+              f"({resultado['cadastros_por_segundo']:.0f}/s)")
+        print("❌ FALHOU" if falhou else "✅ OK")
+    return 1 if falhou else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estresse de escrita concorrente no mesmo usuário.")
+    parser.add_argument("--processos", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4, help="sessões por processo")
+    parser.add_argument("--registros", type=int, default=200, help="registros por sessão")
+    parser.add_argument("--limite-diario", type=int, default=16 * 1024,
+                        help="bytes do diário que disparam compactação (baixo para compactar durante a carga)")
+    parser.add_argument("--usuarios", type=int, default=50, help="cadastros por processo no backend CSV")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    parser.add_argument("--manter", action="store_true", help="não apaga a pasta temporária no fim")
+    args = parser.parse_args(argv)
+
+    diretorio = tempfile.mkdtemp(prefix="estresse_")
+    inicial = os.getcwd()
+    try:
+        return _estressar(args, diretorio)
+    finally:
+        os.chdir(inicial)
+        if args.manter:
+            print(f"Arquivos mantidos em {diretorio}", file=sys.stderr)
+        else:
+            shutil.rmtree(diretorio, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
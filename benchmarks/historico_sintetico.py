@@ -0,0 +1,102 @@
+import os
+import sys
+import argparse
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import numpy as np
+import pandas as pd
+from armazenamento import COLUNAS_DADOS
+from calculo import calcular_doses_lote
+
+# --- HISTÓRICO SINTÉTICO DE UM PACIENTE ---
+# Gera N leituras realistas e reprodutíveis (mesma semente = mesmo histórico):
+#   - refeições em horários fixos com variação de alguns minutos: café, almoço,
+#     lanche, jantar e ceia, mais uma leitura de madrugada em parte das noites;
+#   - carboidratos por refeição (ceia e madrugada só correção);
+#   - glicemia log-normal, mais alta depois do café e à noite, com ~3% de hipoglicemias
+#     (40-69, sem insulina e com 15 g de carboidrato para corrigir);
+#   - ICR diferente por refeição e que muda de tempos em tempos, como nos ajustes médicos;
+#   - históricos grandes não passam de ANOS_MAXIMOS: o que não cabe nas refeições vira
+#     medições avulsas (sem carbos, só correção) espalhadas pelo dia, como um sensor.
+# A dose é a mesma fórmula do app. Uso pela linha de comando:
+#   python benchmarks/historico_sintetico.py 100000 -o db_teste.csv
+
+# (hora, minuto, média de carbos, desvio, ICR base)
+REFEICOES = [
+    (3, 0, 0, 0, 12),      # madrugada: só correção
+    (7, 0, 45, 12, 8),     # café
+    (12, 30, 70, 18, 12),  # almoço
+    (16, 0, 25, 8, 12),    # lanche
+    (19, 30, 60, 15, 10),  # jantar
+    (22, 30, 0, 0, 12),    # ceia: só correção
+]
+PROB_MADRUGADA = 0.3
+ANOS_MAXIMOS = 10
+PROB_HIPO = 0.03
+DIAS_POR_AJUSTE_ICR = 60
+
+
+def gerar_historico(n, semente=0, inicio=datetime(2020, 1, 1)):
+    rnd = np.random.default_rng(semente)
+    # Gera dias de sobra e corta em n leituras. "refeicao" >= len(REFEICOES) = medição avulsa
+    por_dia = len(REFEICOES) - 1 + PROB_MADRUGADA
+    avulsas = max(0, int(np.ceil(n / (ANOS_MAXIMOS * 365) - por_dia)))
+    slots = len(REFEICOES) + avulsas
+    dias = int(n / (por_dia + avulsas) * 1.05) + 2
+    refeicao = np.tile(np.arange(slots), dias)
+    dia = np.repeat(np.arange(dias), slots)
+    manter = (refeicao != 0) | (rnd.random(len(refeicao)) < PROB_MADRUGADA)
+    refeicao, dia = refeicao[manter], dia[manter]
+
+    tabela = np.array(REFEICOES + [(0, 0, 0, 0, 12)], dtype=float)
+    tipo = np.minimum(refeicao, len(REFEICOES))
+    minutos = np.where(refeicao < len(REFEICOES),
+                       tabela[tipo, 0] * 60 + tabela[tipo, 1] + rnd.normal(0, 20, len(tipo)).round(),
+                       rnd.integers(0, 24 * 60, len(tipo)))
+    minutos = np.clip(minutos, 0, 24 * 60 - 1).astype(np.int64)
+    ordem = np.argsort(dia * 24 * 60 + minutos, kind="stable")[:n]
+    refeicao, dia, minutos = tipo[ordem], dia[ordem], minutos[ordem]
+    n = len(refeicao)
+    # strftime em 1M datas leva ~10s: formata cada dia e cada minuto do dia uma vez só
+    # e junta os textos
+    texto_dia = pd.date_range(inicio, periods=dia.max() + 1, freq="D").strftime("%d/%m/%Y").to_numpy(dtype=object)
+    texto_hora = np.array([f" {m // 60:02d}:{m % 60:02d}" for m in range(24 * 60)], dtype=object)
+
+    carbos = np.clip(rnd.normal(tabela[refeicao, 2], tabela[refeicao, 3]), 0, 200).round()
+    pos_cafe = np.where(refeicao == 1, 25.0, 0.0)
+    noite = np.where(refeicao >= 4, 15.0, 0.0)
+    glicemia = np.clip(rnd.lognormal(np.log(135), 0.3, n) + pos_cafe + noite, 70, 450).round()
+    hipo = rnd.random(n) < PROB_HIPO
+    glicemia[hipo] = rnd.integers(40, 70, int(hipo.sum()))
+    carbos[hipo] = 15
+
+    # ICR: base da refeição +-2, trocando a cada DIAS_POR_AJUSTE_ICR dias
+    ajuste = rnd.integers(-2, 3, dia.max() // DIAS_POR_AJUSTE_ICR + 1)
+    icr = np.clip(tabela[refeicao, 4] + ajuste[dia // DIAS_POR_AJUSTE_ICR], 5, 20)
+
+    dose = calcular_doses_lote(glicemia, carbos, icr)["dose_final"]
+    dose[hipo] = 0
+
+    return pd.DataFrame({
+        "Data": texto_dia[dia] + texto_hora[minutos],
+        "Glicemia": glicemia.astype(np.int64),
+        "Carbos": carbos.astype(np.int64),
+        "ICR": icr.astype(np.int64),
+        "Dose": dose,
+    })[COLUNAS_DADOS]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera um histórico sintético de leituras.")
+    parser.add_argument("n", type=int, help="número de leituras")
+    parser.add_argument("-o", "--saida", default="-", help="CSV de saída (padrão: saída padrão)")
+    parser.add_argument("--semente", type=int, default=0)
+    args = parser.parse_args(argv)
+    df = gerar_historico(args.n, args.semente)
+    df.to_csv(sys.stdout if args.saida == "-" else args.saida, index=False)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# --- TEMPO DE IMPORTAÇÃO E PARTIDA A FRIO ---
+# Cada medição roda num interpretador novo (nada em cache no sys.modules).
+#   importacao: tempo para importar o que cada etapa do app precisa
+#   partida:    executa app.py headless (AppTest) até a tela de login e mede o total
+# Uso: python benchmarks/tempo_inicializacao.py [--repeticoes 5] [--json]
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CENARIOS_IMPORTACAO = {
+    # O que o app importava no topo antes da divisão, só para mostrar a tela de login
+    "login (imports antigos)": "import streamlit, pandas, matplotlib.pyplot, fpdf, pytz, urllib.parse",
+    "login (agora)": "import streamlit, usuarios",
+    "área logada + cálculo": "import streamlit, usuarios, pandas, pytz, armazenamento, calculo",
+    "relatórios": "import streamlit, usuarios, pandas, pytz, armazenamento, calculo, graficos, relatorios, resumos, simulacao",
+}
+
+PESADOS = ["pandas", "numpy", "matplotlib", "fpdf", "pyarrow"]
+
+SCRIPT_PARTIDA = """
+import os, sys, time, json, tempfile
+inicio = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+os.chdir(tempfile.mkdtemp())
+app = AppTest.from_file(os.path.join(sys.argv[1], "app.py"), default_timeout=120)
+app.run()
+total = time.perf_counter() - inicio
+print(json.dumps({"segundos": total, "erro": bool(app.exception),
+                  "carregados": [m for m in sys.argv[2:] if m in sys.modules]}))
+"""
+
+
+def _medir_importacao(codigo):
+    script = f"import time; t = time.perf_counter(); {codigo}; print(time.perf_counter() - t)"
+    saida = subprocess.run([sys.executable, "-c", script], cwd=RAIZ, capture_output=True, text=True, check=True)
+    return float(saida.stdout.strip().splitlines()[-1])
+
+def _medir_partida():
+    saida = subprocess.run([sys.executable, "-c", SCRIPT_PARTIDA, RAIZ, *PESADOS],
+                           cwd=RAIZ, capture_output=True, text=True, check=True)
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tempo de importação e partida a frio do app.")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    args = parser.parse_args(argv)
+
+    resultado = {"importacao": {}, "partida_login": None}
+    for nome, codigo in CENARIOS_IMPORTACAO.items():
+        tempos = [_medir_importacao(codigo) for _ in range(args.repeticoes)]
+        resultado["importacao"][nome] = {"mediana_s": statistics.median(tempos), "min_s": min(tempos)}
+
+    partidas = [_medir_partida() for _ in range(args.repeticoes)]
+    resultado["partida_login"] = {
+        "mediana_s": statistics.median(p["segundos"] for p in partidas),
+        "modulos_pesados_carregados": partidas[-1]["carregados"],
+        "erro": any(p["erro"] for p in partidas),
+    }
+
+    if args.json:
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
+        return 0
+    print(f"{'cenário':<28} {'mediana':>9} {'mínimo':>9}")
+    for nome, r in resultado["importacao"].items():
+        print(f"{nome:<28} {r['mediana_s'] * 1000:>7.0f}ms {r['min_s'] * 1000:>7.0f}ms")
+    p = resultado["partida_login"]
+    print(f"\nPartida a frio até a tela de login: {p['mediana_s'] * 1000:.0f}ms (mediana)")
+    print(f"Módulos pesados carregados no login: {', '.join(p['modulos_pesados_carregados']) or 'nenhum'}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
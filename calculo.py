@@ -0,0 +1,124 @@
+import sys
+import argparse
+
+# --- CÁLCULO DA DOSE (SEM STREAMLIT) ---
+# Mesma fórmula do botão "CALCULAR E REGISTRAR":
+#   correção = (glicemia - alvo) / sensibilidade, só quando acima do alvo
+#   refeição = carbos / ICR
+#   dose     = round(correção + refeição)
+# Pode ser importado por scripts, testes ou pela linha de comando:
+#   python calculo.py leituras.csv -o doses.csv
+
+# --- PARÂMETROS FIXOS ---
+ALVO = 100
+FATOR_SENSIBILIDADE = 40
+LIMITE_HIPO = 70
+
+
+def eh_hipoglicemia(glicemia):
+    return 0 < glicemia < LIMITE_HIPO
+
+def calcular_dose(glicemia, carbos, icr, alvo=ALVO, sensibilidade=FATOR_SENSIBILIDADE):
+    if glicemia > alvo:
+        correcao = (glicemia - alvo) / sensibilidade
+    else:
+        correcao = 0
+    refeicao = carbos / icr
+    dose_total = correcao + refeicao
+    return {
+        "glicemia": glicemia,
+        "dose_final": round(dose_total),
+        "correcao": correcao,
+        "refeicao": refeicao,
+        "dose_total": dose_total,
+    }
+
+def calcular_doses_lote(glicemias, carbos, icrs, alvo=ALVO, sensibilidade=FATOR_SENSIBILIDADE):
+    # Versão vetorizada: recebe arrays (ou escalares que se espalham por broadcasting).
+    # numpy é importado aqui para o cálculo de uma dose só não pagar por ele.
+    # Linha inválida (glicemia ou carbos NaN/negativos, ICR <= 0, conta não finita): sai
+    # com valida=False, NaN nas contas e dose_final 0 — inf/NaN nunca vira inteiro.
+    import numpy as np
+    glicemias = np.asarray(glicemias, dtype=float)
+    carbos = np.asarray(carbos, dtype=float)
+    icrs = np.asarray(icrs, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correcao = np.where(glicemias > alvo, (glicemias - alvo) / sensibilidade, 0.0)
+        refeicao = carbos / icrs
+    dose_total = correcao + refeicao
+    valida = ((glicemias >= 0) & (carbos >= 0) & (icrs > 0) & np.isfinite(icrs)
+              & np.isfinite(dose_total))
+    dose_total = np.where(valida, dose_total, np.nan)
+    return {
+        "correcao": np.where(valida, correcao, np.nan),
+        "refeicao": np.where(valida, refeicao, np.nan),
+        "dose_total": dose_total,
+        # np.round arredonda meio para o par, igual ao round() do Python
+        "dose_final": np.where(valida, np.round(dose_total), 0).astype(np.int64),
+        "hipoglicemia": (glicemias > 0) & (glicemias < LIMITE_HIPO),
+        "valida": valida,
+    }
+
+
+# --- LINHA DE COMANDO ---
+def _numerico(coluna):
+    # Vazio = não informado (0); texto que não é número vira NaN e invalida a linha
+    import pandas as pd
+    return pd.to_numeric(coluna, errors="coerce").mask(coluna.isna(), 0)
+
+def _processar_lote(df, icr_padrao, alvo, sensibilidade):
+    # Linhas inválidas ficam no CSV sem dose e com o motivo na coluna Erro
+    import numpy as np
+    import pandas as pd
+    glicemias = _numerico(df["Glicemia"])
+    carbos = _numerico(df["Carbos"])
+    icrs = _numerico(df["ICR"].fillna(icr_padrao)) if "ICR" in df.columns else icr_padrao
+    resultado = calcular_doses_lote(glicemias, carbos, icrs, alvo, sensibilidade)
+    valida = resultado["valida"]
+    df = df.copy()
+    df["ICR"] = icrs
+    df["Correcao"] = resultado["correcao"].round(2)
+    df["Refeicao"] = resultado["refeicao"].round(2)
+    df["Dose_Total"] = resultado["dose_total"].round(2)
+    df["Dose"] = pd.Series(resultado["dose_final"], index=df.index, dtype="Int64").mask(~valida)
+    df["Hipoglicemia"] = resultado["hipoglicemia"]
+    df["Erro"] = np.select(
+        [~(glicemias >= 0), ~(carbos >= 0), ~((df["ICR"] > 0) & np.isfinite(df["ICR"])), ~valida],
+        ["Glicemia inválida", "Carbos inválidos", "ICR inválido", "Dose inválida"], default="")
+    return df
+
+def main(argv=None):
+    import pandas as pd
+    parser = argparse.ArgumentParser(description="Calcula as doses de insulina de um CSV de leituras (colunas Glicemia, Carbos e opcionalmente ICR).")
+    parser.add_argument("entrada", help="CSV de entrada ('-' para ler da entrada padrão)")
+    parser.add_argument("-o", "--saida", default="-", help="CSV de saída (padrão: saída padrão)")
+    parser.add_argument("--icr", type=float, default=10, help="ICR para linhas sem a coluna ICR (padrão: 10)")
+    parser.add_argument("--alvo", type=float, default=ALVO)
+    parser.add_argument("--sensibilidade", type=float, default=FATOR_SENSIBILIDADE)
+    parser.add_argument("--lote", type=int, default=100_000, help="linhas processadas por vez")
+    args = parser.parse_args(argv)
+    if args.icr <= 0 or args.sensibilidade <= 0:
+        parser.error("--icr e --sensibilidade precisam ser maiores que zero")
+
+    entrada = sys.stdin if args.entrada == "-" else args.entrada
+    saida = sys.stdout if args.saida == "-" else open(args.saida, "w", newline="")
+    total = invalidas = 0
+    try:
+        for i, lote in enumerate(pd.read_csv(entrada, chunksize=args.lote)):
+            faltando = {"Glicemia", "Carbos"} - set(lote.columns)
+            if faltando:
+                parser.error(f"coluna(s) ausente(s) no CSV: {', '.join(sorted(faltando))}")
+            resultado = _processar_lote(lote, args.icr, args.alvo, args.sensibilidade)
+            resultado.to_csv(saida, index=False, header=(i == 0))
+            total += len(resultado)
+            invalidas += int((resultado["Erro"] != "").sum())
+    finally:
+        if saida is not sys.stdout:
+            saida.close()
+    print(f"{total - invalidas} doses calculadas.", file=sys.stderr)
+    if invalidas:
+        print(f"{invalidas} linha(s) inválida(s) sem dose (motivo na coluna Erro).", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
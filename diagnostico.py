@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# --- DIAGNÓSTICO: QUANTO TEMPO CADA PARTE DO RERUN LEVA ---
+# with medir("carregar_dados"): ...  marca um trecho. Custo: dois perf_counter, um
+# append e uma soma sob trava, então pode ficar ligado em produção.
+#   - Os trechos do rerun atual ficam numa lista por thread (cada sessão do Streamlit
+#     roda na sua thread): iniciar_rerun() zera, finalizar_rerun() fecha e exporta.
+#   - Todo trecho também entra nos agregados do processo (contagem, soma, máximo),
+#     inclusive os que rodam fora de um rerun (ex.: o PDF montado no download).
+# Exportação (opcional, por variável de ambiente):
+#   CALC_LOG_DIAGNOSTICO=diag.jsonl    uma linha JSON por rerun, com os trechos
+#   CALC_METRICAS_ARQUIVO=metricas.prom agregados no formato texto do Prometheus
+#                                       (regravado no máximo a cada INTERVALO_METRICAS s)
+# Só usa a biblioteca padrão: pode ser importado já na tela de login.
+
+ARQUIVO_LOG = os.environ.get("CALC_LOG_DIAGNOSTICO")
+ARQUIVO_METRICAS = os.environ.get("CALC_METRICAS_ARQUIVO")
+INTERVALO_METRICAS = 10
+
+_local = threading.local()
+_agregados = {}  # trecho -> [contagem, soma_s, max_s]
+_coletores = {}  # prefixo -> função que devolve {nome: valor}
+_guarda = threading.Lock()
+_ultima_exportacao = [0.0]
+
+
+def iniciar_rerun(usuario=None):
+    _local.rerun = {"inicio": time.perf_counter(), "hora": time.time(), "usuario": usuario, "trechos": []}
+    _local.nivel = 0
+
+def _registrar(nome, segundos):
+    with _guarda:
+        agregado = _agregados.get(nome)
+        if agregado is None:
+            _agregados[nome] = [1, segundos, segundos]
+        else:
+            agregado[0] += 1
+            agregado[1] += segundos
+            if segundos > agregado[2]:
+                agregado[2] = segundos
+
+@contextmanager
+def medir(nome):
+    rerun = getattr(_local, "rerun", None)
+    nivel = getattr(_local, "nivel", 0)
+    _local.nivel = nivel + 1
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        _local.nivel = nivel
+        if rerun is not None:
+            rerun["trechos"].append({"trecho": nome, "nivel": nivel, "inicio_s": inicio - rerun["inicio"],
+                                     "segundos": segundos})
+        _registrar(nome, segundos)
+
+def finalizar_rerun():
+    rerun = getattr(_local, "rerun", None)
+    if rerun is None:
+        return None
+    _local.rerun = None
+    total = time.perf_counter() - rerun["inicio"]
+    _registrar("rerun", total)
+    resumo = {"hora": rerun["hora"], "usuario": rerun["usuario"], "total_s": total,
+              "trechos": sorted(rerun["trechos"], key=lambda t: t["inicio_s"])}
+    _exportar(resumo)
+    return resumo
+
+def agregados():
+    with _guarda:
+        return {nome: {"contagem": c, "soma_s": s, "media_s": s / c, "max_s": m}
+                for nome, (c, s, m) in _agregados.items()}
+
+def registrar_coletor(prefixo, coletar):
+    # coletar() devolve {nome: número}; vira calc_{prefixo}_{nome} nas métricas
+    _coletores[prefixo] = coletar
+
+def coletar_extras():
+    extras = {}
+    for prefixo, coletar in list(_coletores.items()):
+        try:
+            for nome, valor in coletar().items():
+                extras[f"calc_{prefixo}_{nome}"] = valor
+        except Exception:
+            pass  # métrica extra nunca pode derrubar o app
+    return extras
+
+
+# --- EXPORTAÇÃO ---
+def texto_prometheus():
+    linhas = [
+        "# HELP calc_trecho_segundos Tempo gasto em cada trecho do app.",
+        "# TYPE calc_trecho_segundos summary",
+    ]
+    dados = agregados()
+    for nome, a in sorted(dados.items()):
+        linhas.append(f'calc_trecho_segundos_count{{trecho="{nome}"}} {a["contagem"]}')
+        linhas.append(f'calc_trecho_segundos_sum{{trecho="{nome}"}} {a["soma_s"]:.6f}')
+    linhas.append("# HELP calc_trecho_segundos_max Maior tempo visto em cada trecho.")
+    linhas.append("# TYPE calc_trecho_segundos_max gauge")
+    for nome, a in sorted(dados.items()):
+        linhas.append(f'calc_trecho_segundos_max{{trecho="{nome}"}} {a["max_s"]:.6f}')
+    for nome, valor in sorted(coletar_extras().items()):
+        linhas.append(f"# TYPE {nome} gauge")
+        linhas.append(f"{nome} {valor}")
+    return "\n".join(linhas) + "\n"
+
+def _exportar(resumo):
+    try:
+        if ARQUIVO_LOG:
+            linha = json.dumps(resumo, ensure_ascii=False) + "\n"
+            with _guarda, open(ARQUIVO_LOG, "a", encoding="utf-8") as f:
+                f.write(linha)
+        if ARQUIVO_METRICAS and time.monotonic() - _ultima_exportacao[0] >= INTERVALO_METRICAS:
+            _ultima_exportacao[0] = time.monotonic()
+            gravar_metricas(ARQUIVO_METRICAS)
+    except OSError:
+        pass  # disco cheio / sem permissão: o diagnóstico não pode derrubar o app
+
+def gravar_metricas(caminho):
+    # Temporário + rename: quem lê (ex.: node_exporter textfile) nunca vê arquivo pela metade
+    tmp = f"{caminho}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(texto_prometheus())
+    os.replace(tmp, caminho)
@@ -0,0 +1,117 @@
+import io
+import threading
+from collections import OrderedDict
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+import matplotlib.dates as mdates
+
+# --- GRÁFICO "EVOLUÇÃO NO PERÍODO" ---
+# Eixo X com datas de verdade (não texto), séries longas reduzidas com LTTB para
+# no máximo ~1 ponto por pixel, e a imagem PNG guardada em cache com chave
+# (usuário, período, indicadores, versão dos dados). A mesma imagem vai para a
+# tela e para o PDF, sem passar por arquivo temporário.
+
+LARGURA_POL, ALTURA_POL, DPI = 8, 4, 100
+MAX_PONTOS = LARGURA_POL * DPI
+MAX_PONTOS_COM_MARCADOR = 60
+MAX_GRAFICOS_EM_CACHE = 64
+
+ESTILOS = {
+    "Glicemia": dict(marker='o', label='Glicemia', color='blue'),
+    "Carbos": dict(marker='s', label='Carbos (g)', color='orange', linestyle='-.'),
+    "Dose": dict(marker='^', label='Dose (u)', color='green'),
+}
+
+_cache_graficos = OrderedDict()
+_cache_guarda = threading.Lock()
+
+
+def lttb(x, y, n_saida):
+    # Largest-Triangle-Three-Buckets: mantém picos e vales escolhendo, em cada balde,
+    # o ponto que forma o maior triângulo com o escolhido antes e a média do próximo balde
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_saida >= n or n_saida < 3:
+        return np.arange(n)
+
+    indices = np.empty(n_saida, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    bordas = np.linspace(1, n - 1, n_saida - 1).astype(np.int64)
+    anterior = 0
+    for i in range(n_saida - 2):
+        ini, fim = bordas[i], bordas[i + 1]
+        prox_ini, prox_fim = bordas[i + 1], (bordas[i + 2] if i + 2 < len(bordas) else n)
+        media_x = x[prox_ini:prox_fim].mean()
+        media_y = y[prox_ini:prox_fim].mean()
+        areas = np.abs(
+            (x[anterior] - media_x) * (y[ini:fim] - y[anterior])
+            - (x[anterior] - x[ini:fim]) * (media_y - y[anterior])
+        )
+        anterior = ini + int(np.argmax(areas))
+        indices[i + 1] = anterior
+    return indices
+
+def renderizar_grafico(df, metricas, alvo, max_pontos=MAX_PONTOS):
+    fig = Figure(figsize=(LARGURA_POL, ALTURA_POL), dpi=DPI)
+    ax = fig.add_subplot()
+    datas = df['Data_DT'].to_numpy()
+    x_num = datas.astype("datetime64[s]").astype(np.int64)
+
+    for metrica in ["Glicemia", "Carbos", "Dose"]:
+        if metrica not in metricas:
+            continue
+        y = df[metrica].to_numpy(dtype=float)
+        idx = lttb(x_num, y, max_pontos)
+        estilo = dict(ESTILOS[metrica])
+        if len(idx) > MAX_PONTOS_COM_MARCADOR:
+            estilo.pop('marker')
+        ax.plot(datas[idx], y[idx], **estilo)
+        if metrica == "Glicemia":
+            ax.axhline(y=alvo, color='red', linestyle='--', alpha=0.5, label='Alvo')
+
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%d/%m\n%H:%M"))
+    ax.xaxis.set_major_locator(mdates.AutoDateLocator(maxticks=10))
+    ax.set_title("Evolução no Período")
+    ax.grid(True, alpha=0.3)
+    ax.legend()
+    fig.tight_layout()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+def renderizar_agp(agp, faixa_alvo):
+    # agp: saída de analise.perfil_agp (P10..P90 por hora do dia)
+    fig = Figure(figsize=(LARGURA_POL, ALTURA_POL), dpi=DPI)
+    ax = fig.add_subplot()
+    horas = agp.index.to_numpy()
+    ax.axhspan(*faixa_alvo, color='green', alpha=0.08, label=f'Alvo {faixa_alvo[0]}-{faixa_alvo[1]}')
+    ax.fill_between(horas, agp['P10'], agp['P90'], color='blue', alpha=0.12, label='10-90%')
+    ax.fill_between(horas, agp['P25'], agp['P75'], color='blue', alpha=0.3, label='25-75%')
+    ax.plot(horas, agp['P50'], color='blue', marker='o' if len(horas) <= 24 else None, label='Mediana')
+    ax.set_xlim(0, 23)
+    ax.set_xticks(range(0, 24, 3))
+    ax.set_xticklabels([f"{h:02d}h" for h in range(0, 24, 3)])
+    ax.set_title("Perfil Glicêmico por Hora do Dia (AGP)")
+    ax.grid(True, alpha=0.3)
+    ax.legend(loc='upper right')
+    fig.tight_layout()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+def grafico_em_cache(chave, gerar):
+    with _cache_guarda:
+        if chave in _cache_graficos:
+            _cache_graficos.move_to_end(chave)
+            return _cache_graficos[chave]
+    png = gerar()
+    with _cache_guarda:
+        _cache_graficos[chave] = png
+        while len(_cache_graficos) > MAX_GRAFICOS_EM_CACHE:
+            _cache_graficos.popitem(last=False)
+    return png
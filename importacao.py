@@ -0,0 +1,131 @@
+import time
+import numpy as np
+import pandas as pd
+import armazenamento
+
+# --- IMPORTAÇÃO DE BACKUP EM LOTES ---
+# Lê o CSV em pedaços (memória limitada ao tamanho do lote), valida e converte cada
+# pedaço, descarta registros repetidos e grava. Repetido = mesmo ID de um registro já
+# existente ou já importado; linhas sem ID (backups de antes dos IDs) usam a regra antiga,
+# mesmo horário (dois registros no mesmo minuto só são distinguíveis pelo ID).
+# Um registro apagado que volta num "mesclar" ganha ID novo (o antigo tem lápide) e
+# entra em "recuperados" no relatório.
+#   "mesclar":    os aceitos são anexados ao diário do usuário, lote a lote;
+#   "substituir": os aceitos viram o novo histórico, gravado em fluxo e confirmado
+#                 só no final (se der erro no meio, o histórico antigo continua).
+#                 Também não confirma quando nada foi aceito ou quando mais de
+#                 LIMITE_REJEITADOS das linhas foi rejeitada (ex.: datas em outro formato):
+#                 isso apagaria o histórico do paciente trocando-o por quase nada.
+
+TAMANHO_LOTE = 10_000
+LIMITES = {"Glicemia": (0, 600), "Carbos": (0, 300), "ICR": (1, 100), "Dose": (0, 100)}
+MODOS = ("mesclar", "substituir")
+LIMITE_REJEITADOS = 0.5
+
+
+def _validar(lote, relatorio):
+    total = len(lote)
+    lote = lote.copy()
+    lote['Data'] = lote['Data'].astype(str).str.strip()
+    lote['Data_DT'] = pd.to_datetime(lote['Data'], format=armazenamento.FORMATO_DATA, errors="coerce")
+    validos = lote['Data_DT'].notna()
+    motivos = relatorio["motivos"]
+    motivos["data invalida"] = motivos.get("data invalida", 0) + int((~validos).sum())
+
+    for coluna, (minimo, maximo) in LIMITES.items():
+        if coluna not in lote.columns:
+            lote[coluna] = 0 if coluna != "ICR" else pd.NA
+        valores = pd.to_numeric(lote[coluna], errors="coerce")
+        if coluna in ("Glicemia", "Carbos", "Dose"):
+            valores = valores.fillna(0)  # campo vazio = não informado
+        ok = valores.between(minimo, maximo)
+        motivos[f"{coluna} invalido"] = motivos.get(f"{coluna} invalido", 0) + int((validos & ~ok).sum())
+        validos &= ok
+        lote[coluna] = valores
+
+    aceitos = lote[validos]
+    relatorio["rejeitados"] += total - len(aceitos)
+    return aceitos
+
+def _vistos(df):
+    # Chaves de duplicidade de um histórico: IDs e horários (em ns)
+    if df.empty or 'Data_DT' not in df.columns:
+        return {"ids": set(), "datas": set()}
+    return {"ids": set(df['ID'].dropna().tolist()),
+            "datas": set(df['Data_DT'].to_numpy().astype("datetime64[ns]").astype("int64").tolist())}
+
+def _sem_duplicados(lote, vistos, relatorio):
+    datas = lote['Data_DT'].to_numpy().astype("datetime64[ns]").astype("int64")
+    ids = lote['ID'] if 'ID' in lote.columns else pd.Series(None, index=lote.index, dtype=object)
+    com_id = ids.notna().to_numpy()
+    por_id = ids.duplicated().to_numpy() | ids.isin(vistos["ids"]).to_numpy()
+    por_data = pd.Series(datas).duplicated().to_numpy() | pd.Series(datas).isin(vistos["datas"]).to_numpy()
+    manter = ~np.where(com_id, por_id, por_data)
+    vistos["ids"].update(ids[manter & com_id].tolist())
+    vistos["datas"].update(datas[manter].tolist())
+    relatorio["duplicados"] += int((~manter).sum())
+    return lote[manter]
+
+def _inteiros_se_possivel(lote):
+    for coluna in LIMITES:
+        if (lote[coluna] % 1 == 0).all():
+            lote[coluna] = lote[coluna].astype("int64")
+    return lote
+
+def _lotes_aceitos(arquivo, vistos, apagados, relatorio, tamanho_lote):
+    leitor = pd.read_csv(arquivo, chunksize=tamanho_lote, dtype=str, skipinitialspace=True)
+    for lote in leitor:
+        if 'Data' not in lote.columns:
+            raise ValueError("O arquivo não tem a coluna 'Data'.")
+        relatorio["lidos"] += len(lote)
+        lote = _sem_duplicados(_validar(lote, relatorio), vistos, relatorio)
+        if lote.empty:
+            continue
+        relatorio["aceitos"] += len(lote)
+        if 'ID' not in lote.columns:
+            lote['ID'] = None  # backup antigo: o armazenamento cria os IDs
+        elif apagados:
+            recuperados = lote['ID'].isin(apagados)
+            if recuperados.any():
+                lote = lote.copy()
+                lote.loc[recuperados, 'ID'] = None
+                relatorio["recuperados"] += int(recuperados.sum())
+        yield _inteiros_se_possivel(lote[armazenamento.COLUNAS].reset_index(drop=True))
+
+def _conferir_substituicao(relatorio):
+    motivos = ", ".join(f"{m}: {n}" for m, n in relatorio["motivos"].items() if n)
+    detalhe = f" ({motivos})" if motivos else ""
+    if relatorio["aceitos"] == 0:
+        raise ValueError(f"Nenhum registro válido no arquivo{detalhe}. O histórico atual foi mantido.")
+    if relatorio["rejeitados"] > LIMITE_REJEITADOS * relatorio["lidos"]:
+        raise ValueError(f"{relatorio['rejeitados']} de {relatorio['lidos']} linhas rejeitadas{detalhe}. "
+                         "O histórico atual foi mantido.")
+
+def _conferidos(lotes, relatorio):
+    # Roda dentro da gravação do novo snapshot: o erro no fim do fluxo acontece antes
+    # da confirmação, e o armazenamento descarta o que foi escrito
+    yield from lotes
+    _conferir_substituicao(relatorio)
+
+def importar_backup(arquivo, arquivo_db, modo="mesclar", tamanho_lote=TAMANHO_LOTE):
+    if modo not in MODOS:
+        raise ValueError(f"Modo desconhecido: {modo}")
+    relatorio = {"lidos": 0, "aceitos": 0, "rejeitados": 0, "duplicados": 0, "recuperados": 0, "motivos": {}}
+    inicio = time.perf_counter()
+
+    vistos = _vistos(armazenamento.carregar(arquivo_db) if modo == "mesclar" else pd.DataFrame())
+    # Na substituição as lápides antigas somem junto com o histórico
+    apagados = armazenamento.ids_apagados(arquivo_db) if modo == "mesclar" else set()
+
+    lotes = _lotes_aceitos(arquivo, vistos, apagados, relatorio, tamanho_lote)
+    if modo == "mesclar":
+        for lote in lotes:
+            armazenamento.anexar_lote(arquivo_db, lote, compactar_se_grande=False)
+        armazenamento.compactar(arquivo_db)
+    else:
+        armazenamento.substituir_em_lotes(arquivo_db, _conferidos(lotes, relatorio))
+
+    relatorio["segundos"] = time.perf_counter() - inicio
+    relatorio["linhas_por_segundo"] = relatorio["lidos"] / relatorio["segundos"] if relatorio["segundos"] else 0
+    relatorio["motivos"] = {m: n for m, n in relatorio["motivos"].items() if n}
+    return relatorio
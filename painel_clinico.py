@@ -0,0 +1,150 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+import pandas as pd
+import armazenamento
+from calculo import LIMITE_HIPO
+
+# --- PAINEL DA EQUIPE CLÍNICA (VÁRIOS PACIENTES, SÓ LEITURA) ---
+# Encontra todos os pacientes pelos arquivos db_*.csv / db_*.parquet / db_*.journal e
+# resume cada um no período escolhido: média da glicemia, hipoglicemias e insulina total.
+# - O resumo de cada paciente fica em cache com a versão dos arquivos dele (inode, mtime,
+#   tamanho): paciente que não mudou não é lido de novo.
+# - Os que mudaram são lidos em paralelo num pool de processos ("spawn") que só existe
+#   durante a varredura: o painel é pouco usado e cada processo é um interpretador com
+#   pandas, que não deve ficar parado no servidor. Até N_PROCESSOS processos
+#   (CALC_PROCESSOS_PAINEL, padrão min(4, núcleos)). Menos de MINIMO_PARA_PARALELO
+#   pacientes são lidos aqui mesmo, sem pagar o custo de subir o pool. Se o pool quebrar
+#   (processo morto, ambiente que não deixa criar processos), a leitura é refeita aqui.
+# - A leitura é a consultar_periodo_sem_alterar: o painel nunca escreve nos arquivos dos
+#   pacientes (não termina compactação, não cria IDs, não converte para colunar).
+# Glicemia 0 = não informada: fica fora da média e das hipoglicemias.
+# Linha de comando (também serve para medir):
+#   python painel_clinico.py --inicio 2024-01-01 --fim 2024-01-31
+
+PADROES = ["db_*.csv", "db_*.parquet", "db_*.journal"]
+MINIMO_PARA_PARALELO = 8
+N_PROCESSOS = int(os.environ.get("CALC_PROCESSOS_PAINEL", min(4, os.cpu_count() or 2)))
+MAX_RESUMOS_EM_CACHE = 4096
+COLUNAS_COORTE = ["Paciente", "Registros", "Glicemia Média", "Hipos", "% Hipo", "Insulina Total (u)",
+                  "Carbos Total (g)", "Último Registro"]
+
+_cache_resumos = OrderedDict()  # (arquivo_db, inicio, fim) -> (versao, resumo)
+_cache_guarda = threading.Lock()
+
+
+def listar_pacientes(diretorio="."):
+    # db_maria.csv, db_maria.parquet e db_maria.journal são o mesmo paciente
+    raizes = set()
+    for padrao in PADROES:
+        for caminho in glob.glob(os.path.join(diretorio, padrao)):
+            raizes.add(os.path.splitext(caminho)[0])
+    return sorted(os.path.abspath(r) + ".csv" for r in raizes)
+
+def _nome_paciente(arquivo_db):
+    return os.path.splitext(os.path.basename(arquivo_db))[0][len("db_"):]
+
+def resumir_paciente(arquivo_db, inicio, fim):
+    df = armazenamento.consultar_periodo_sem_alterar(arquivo_db, inicio, fim)
+    glicemia = pd.to_numeric(df['Glicemia'], errors="coerce").fillna(0)
+    medidas = glicemia[glicemia > 0]
+    hipos = int((medidas < LIMITE_HIPO).sum())
+    return {
+        "Paciente": _nome_paciente(arquivo_db),
+        "Registros": len(df),
+        "Glicemia Média": round(float(medidas.mean()), 1) if len(medidas) else None,
+        "Hipos": hipos,
+        "% Hipo": round(100 * hipos / len(medidas), 1) if len(medidas) else None,
+        "Insulina Total (u)": float(pd.to_numeric(df['Dose'], errors="coerce").fillna(0).sum()),
+        "Carbos Total (g)": float(pd.to_numeric(df['Carbos'], errors="coerce").fillna(0).sum()),
+        "Último Registro": df['Data_DT'].iloc[-1] if len(df) else None,
+    }
+
+def _resumir_lote(tarefas):
+    # Roda no processo do pool: vários pacientes por tarefa para diluir a troca de mensagens
+    resultados = []
+    for arquivo_db, inicio, fim in tarefas:
+        try:
+            resultados.append(resumir_paciente(arquivo_db, inicio, fim))
+        except Exception as erro:
+            resultados.append({"Paciente": _nome_paciente(arquivo_db), "erro": repr(erro)})
+    return resultados
+
+def _em_lotes(itens, n_lotes):
+    tamanho = max(1, -(-len(itens) // n_lotes))
+    return [itens[i:i + tamanho] for i in range(0, len(itens), tamanho)]
+
+def resumo_coorte(inicio, fim, diretorio=".", paralelo=True):
+    # Devolve (tabela por paciente, estatísticas da varredura)
+    comeco = time.perf_counter()
+    pacientes = listar_pacientes(diretorio)
+    linhas, pendentes = {}, []
+    with _cache_guarda:
+        for arquivo_db in pacientes:
+            chave = (arquivo_db, inicio, fim)
+            versao = armazenamento.versao(arquivo_db)
+            guardado = _cache_resumos.get(chave)
+            if guardado is not None and guardado[0] == versao:
+                _cache_resumos.move_to_end(chave)
+                linhas[arquivo_db] = guardado[1]
+            else:
+                pendentes.append((arquivo_db, versao))
+
+    tarefas = [(arquivo_db, inicio, fim) for arquivo_db, _ in pendentes]
+    resultados = None
+    if paralelo and N_PROCESSOS > 1 and len(tarefas) >= MINIMO_PARA_PARALELO:
+        try:
+            # "spawn": o servidor do Streamlit tem várias threads, e fork com threads pode travar
+            with ProcessPoolExecutor(max_workers=N_PROCESSOS,
+                                     mp_context=multiprocessing.get_context("spawn")) as pool:
+                lotes = _em_lotes(tarefas, 4 * N_PROCESSOS)
+                resultados = [r for lote in pool.map(_resumir_lote, lotes) for r in lote]
+        except (BrokenProcessPool, OSError):
+            resultados = None
+    if resultados is None:
+        resultados = _resumir_lote(tarefas)
+
+    erros = []
+    with _cache_guarda:
+        for (arquivo_db, versao), resumo in zip(pendentes, resultados):
+            if "erro" in resumo:
+                erros.append(resumo)
+                continue
+            linhas[arquivo_db] = resumo
+            _cache_resumos[(arquivo_db, inicio, fim)] = (versao, resumo)
+        while len(_cache_resumos) > MAX_RESUMOS_EM_CACHE:
+            _cache_resumos.popitem(last=False)
+
+    tabela = pd.DataFrame([linhas[p] for p in pacientes if p in linhas], columns=COLUNAS_COORTE)
+    estatisticas = {"pacientes": len(pacientes), "lidos": len(pendentes) - len(erros),
+                    "do_cache": len(pacientes) - len(pendentes), "erros": erros,
+                    "segundos": time.perf_counter() - comeco}
+    return tabela, estatisticas
+
+
+# --- LINHA DE COMANDO ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resumo de todos os pacientes no período.")
+    parser.add_argument("--diretorio", default=".")
+    parser.add_argument("--inicio", type=date.fromisoformat, default=date.today() - timedelta(days=29))
+    parser.add_argument("--fim", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--sem-paralelo", action="store_true")
+    args = parser.parse_args(argv)
+
+    for rodada in ("fria", "com cache"):
+        tabela, est = resumo_coorte(args.inicio, args.fim, args.diretorio, not args.sem_paralelo)
+        print(f"Varredura {rodada}: {est['pacientes']} pacientes, {est['lidos']} lidos, "
+              f"{est['do_cache']} do cache, {est['segundos']:.2f}s", file=sys.stderr)
+    print(tabela.to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from fpdf import FPDF
+
+# --- RELATÓRIO EM PDF ---
+# O PDF é montado em memória (nada de arquivo compartilhado no disco) e só quando
+# alguém pede o download. Com a análise do período, leva também os indicadores
+# (tempo no alvo, CV, GMI) e o gráfico AGP. O resultado fica num cache pequeno, com chave
+# (usuário, período, indicadores, versão dos dados).
+
+COLUNAS_PDF = [("Data", "Data/Hora", 40), ("Glicemia", "Glicemia", 30), ("Carbos", "Carbos", 30),
+               ("ICR", "ICR", 30), ("Dose", "Dose", 30)]
+ALTURA_LINHA = 10
+MAX_PDFS_EM_CACHE = 32
+
+_cache_pdf = OrderedDict()
+_cache_guarda = threading.Lock()
+
+
+def _cabecalho_tabela(pdf):
+    pdf.set_font("Arial", 'B', 10)
+    for _, titulo, largura in COLUNAS_PDF:
+        pdf.cell(largura, ALTURA_LINHA, titulo, 1)
+    pdf.ln()
+    pdf.set_font("Arial", size=10)
+
+def _inserir_imagem(pdf, png, x, y, w):
+    # O fpdf 1.7 só lê imagem de arquivo: usa um temporário exclusivo desta chamada
+    fd, caminho = tempfile.mkstemp(suffix=".png")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(png)
+        pdf.image(caminho, x=x, y=y, w=w)
+    finally:
+        os.remove(caminho)
+
+def _para_bytes(pdf):
+    saida = pdf.output(dest='S')
+    # fpdf 1.7 devolve str latin-1; o fpdf2 já devolve bytearray
+    return saida.encode('latin-1') if isinstance(saida, str) else bytes(saida)
+
+def gerar_pdf(df_historico, usuario, filtro_msg="Geral", grafico_png=None, linhas_indicadores=None, agp_png=None):
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", 'B', 16)
+    pdf.cell(200, 10, "Relatorio de Controle Glicemico", ln=True, align='C')
+    pdf.set_font("Arial", 'I', 10)
+    pdf.cell(200, 10, f"Paciente: {usuario.capitalize()} | Filtro: {filtro_msg}", ln=True, align='C')
+    pdf.set_font("Arial", size=10)
+    pdf.cell(200, 10, f"Gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M')}", ln=True, align='C')
+    pdf.ln(10)
+
+    if grafico_png:
+        _inserir_imagem(pdf, grafico_png, x=10, y=50, w=190)
+        pdf.ln(100)
+
+    # Indicadores do período (analise.texto_metricas) e o perfil por hora, em página própria
+    if linhas_indicadores:
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(190, 8, "Indicadores do Periodo", ln=True)
+        pdf.set_font("Arial", size=9)
+        for linha in linhas_indicadores:
+            pdf.cell(190, 6, linha, ln=True)
+        pdf.ln(4)
+    if agp_png:
+        pdf.add_page()
+        _inserir_imagem(pdf, agp_png, x=10, y=pdf.get_y(), w=190)
+        pdf.ln(100)
+
+    _cabecalho_tabela(pdf)
+
+    # Converte a tabela inteira para texto de uma vez (sem iterrows)
+    colunas = [c for c, _, _ in COLUNAS_PDF]
+    larguras = [l for _, _, l in COLUNAS_PDF]
+    linhas = df_historico[colunas].astype(str).to_numpy().tolist()
+    limite = pdf.page_break_trigger - ALTURA_LINHA
+    for linha in linhas:
+        if pdf.get_y() > limite:
+            # Página nova com o cabeçalho repetido
+            pdf.add_page()
+            _cabecalho_tabela(pdf)
+        for texto, largura in zip(linha, larguras):
+            pdf.cell(largura, ALTURA_LINHA, texto, 1)
+        pdf.ln()
+
+    return _para_bytes(pdf)
+
+def pdf_em_cache(chave, gerar):
+    # gerar() só roda quando a chave não está no cache
+    with _cache_guarda:
+        if chave in _cache_pdf:
+            _cache_pdf.move_to_end(chave)
+            return _cache_pdf[chave]
+    conteudo = gerar()
+    with _cache_guarda:
+        _cache_pdf[chave] = conteudo
+        while len(_cache_pdf) > MAX_PDFS_EM_CACHE:
+            _cache_pdf.popitem(last=False)
+    return conteudo
@@ -0,0 +1,91 @@
+import threading
+import pandas as pd
+import armazenamento
+from calculo import LIMITE_HIPO
+
+# --- RESUMOS DIÁRIOS POR USUÁRIO ---
+# Para cada dia guardamos: registros, leituras (glicemia informada, > 0), soma da
+# glicemia, carbos, dose e hipoglicemias (glicemia entre 1 e 69). Os totais de um período
+# saem somando dias, não leituras. A média é soma / leituras: glicemia 0 = não informada
+# fica fora, como na análise (analise.py) e no PDF.
+# Inserções e remoções atualizam só o dia afetado (via aviso do armazenamento). Se o
+# resumo não bate com a versão atual dos dados (ex.: outro processo escreveu), ele é
+# reconstruído do zero na próxima consulta.
+
+CAMPOS = ["registros", "leituras", "soma_glicemia", "carbos", "dose", "hipos"]
+
+_resumos = {}  # arquivo_db -> {"versao": ..., "dias": {date: [registros, leituras, soma_glicemia, ...]}}
+_guarda = threading.Lock()
+
+
+def _agregar(df):
+    # Vetorizado: um groupby por dia
+    if df.empty or 'Data_DT' not in df.columns:
+        return {}
+    glicemia = pd.to_numeric(df['Glicemia'], errors="coerce").fillna(0)
+    glicemia = glicemia.where(glicemia > 0, 0)
+    base = pd.DataFrame({
+        "dia": df['Data_DT'].dt.date,
+        "registros": 1,
+        "leituras": (glicemia > 0).astype(int),
+        "soma_glicemia": glicemia,
+        "carbos": pd.to_numeric(df['Carbos'], errors="coerce").fillna(0),
+        "dose": pd.to_numeric(df['Dose'], errors="coerce").fillna(0),
+        "hipos": ((glicemia > 0) & (glicemia < LIMITE_HIPO)).astype(int),
+    })
+    agrupado = base.groupby("dia")[CAMPOS].sum()
+    return {dia: linha.tolist() for dia, linha in zip(agrupado.index, agrupado.to_numpy())}
+
+def reconstruir(arquivo_db):
+    # A versão tem que ser a dos dados lidos (lida junto, sob a trava do arquivo): uma
+    # escrita entre a leitura e a marcação ficaria de fora do resumo para sempre
+    df, versao = armazenamento._carregar_sem_copia(arquivo_db)
+    with _guarda:
+        _resumos[arquivo_db] = {"versao": versao, "dias": _agregar(df)}
+
+def _ao_alterar(evento, arquivo_db, antes, depois, linhas):
+    with _guarda:
+        resumo = _resumos.get(arquivo_db)
+        if resumo is None:
+            return
+        if evento == "substituicao" or resumo["versao"] != antes:
+            # Não dá para atualizar com segurança: fica para reconstruir na próxima consulta
+            del _resumos[arquivo_db]
+            return
+        if evento in ("insercao", "remocao"):
+            sinal = 1 if evento == "insercao" else -1
+            for dia, valores in _agregar(linhas).items():
+                atual = resumo["dias"].setdefault(dia, [0] * len(CAMPOS))
+                for i, valor in enumerate(valores):
+                    atual[i] += sinal * valor
+                if atual[0] <= 0:
+                    del resumo["dias"][dia]
+        resumo["versao"] = depois
+
+armazenamento.registrar_ouvinte(_ao_alterar)
+
+
+def _dias(arquivo_db):
+    with _guarda:
+        resumo = _resumos.get(arquivo_db)
+        em_dia = resumo is not None and resumo["versao"] == armazenamento.versao(arquivo_db)
+    if not em_dia:
+        reconstruir(arquivo_db)
+    with _guarda:
+        return dict(_resumos[arquivo_db]["dias"])
+
+def resumo_periodo(arquivo_db, inicio, fim):
+    totais = [0] * len(CAMPOS)
+    for dia, valores in _dias(arquivo_db).items():
+        if inicio <= dia <= fim:
+            for i, valor in enumerate(valores):
+                totais[i] += valor
+    registros, leituras, soma_glicemia, carbos, dose, hipos = totais
+    return {
+        "registros": int(registros),
+        "leituras": int(leituras),
+        "media_glicemia": soma_glicemia / leituras if leituras else None,
+        "total_carbos": carbos,
+        "total_dose": int(dose) if float(dose).is_integer() else dose,
+        "hipos": int(hipos),
+    }
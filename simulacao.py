@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from calculo import ALVO, FATOR_SENSIBILIDADE, calcular_doses_lote
+
+# --- SIMULADOR "E SE?" ---
+# Recalcula a dose de TODOS os registros para cada combinação de ICR x sensibilidade x
+# alvo e compara com a dose que foi registrada. A grade é percorrida em blocos: um
+# (alvo, sensibilidade) e algumas linhas de ICR por vez, cada bloco vetorizado em NumPy
+# sobre ICRs x registros. A memória fica limitada a ~BLOCO_ELEMENTOS valores por array,
+# qualquer que seja o tamanho da grade. O resultado fica num cache pequeno com chave
+# (usuário, período, versão dos dados, parâmetros).
+
+ICRS_PADRAO = list(range(1, 21))
+PERCENTIS = [5, 25, 50, 75, 95]
+BLOCO_ELEMENTOS = 2_000_000
+MAX_SIMULACOES_EM_CACHE = 16
+
+_cache_simulacoes = OrderedDict()
+_cache_guarda = threading.Lock()
+
+
+def _resumir_bloco(diferenca):
+    # Uma linha por ICR do bloco
+    return {
+        "Diferenca_Media": diferenca.mean(axis=1),
+        "Diferenca_Abs_Media": np.abs(diferenca).mean(axis=1),
+        "Soma_Diferenca": diferenca.sum(axis=1),
+        "%_Maior": (diferenca > 0).mean(axis=1) * 100,
+        "%_Menor": (diferenca < 0).mean(axis=1) * 100,
+        **{f"P{p}": v for p, v in zip(PERCENTIS, np.percentile(diferenca, PERCENTIS, axis=1))},
+    }
+
+def simular_parametros(df, icrs=ICRS_PADRAO, sensibilidades=(FATOR_SENSIBILIDADE,), alvos=(ALVO,)):
+    if df.empty:
+        return pd.DataFrame()
+    glicemia = pd.to_numeric(df['Glicemia'], errors="coerce").fillna(0).to_numpy(dtype=float)
+    carbos = pd.to_numeric(df['Carbos'], errors="coerce").fillna(0).to_numpy(dtype=float)
+    dose_registrada = pd.to_numeric(df['Dose'], errors="coerce").fillna(0).to_numpy(dtype=float)
+    icrs = np.asarray(icrs, dtype=float)
+    por_bloco = max(1, BLOCO_ELEMENTOS // len(glicemia))
+
+    partes = []
+    for alvo in alvos:
+        for sensibilidade in sensibilidades:
+            for i in range(0, len(icrs), por_bloco):
+                icrs_bloco = icrs[i:i + por_bloco]
+                # A mesma fórmula do app: [icr, registro]
+                dose = calcular_doses_lote(glicemia[None, :], carbos[None, :], icrs_bloco[:, None],
+                                           alvo=alvo, sensibilidade=sensibilidade)["dose_final"]
+                resumo = _resumir_bloco(dose - dose_registrada)
+                partes.append(pd.DataFrame({"Alvo": alvo, "Sensibilidade": sensibilidade, "ICR": icrs_bloco, **resumo}))
+
+    resultado = pd.concat(partes, ignore_index=True)
+    resultado.insert(resultado.columns.get_loc("Soma_Diferenca"), "Dose_Total",
+                     dose_registrada.sum() + resultado.pop("Soma_Diferenca"))
+    return resultado
+
+def simulacao_em_cache(chave, gerar):
+    # gerar() só roda quando a chave não está no cache
+    with _cache_guarda:
+        if chave in _cache_simulacoes:
+            _cache_simulacoes.move_to_end(chave)
+            return _cache_simulacoes[chave]
+    resultado = gerar()
+    with _cache_guarda:
+        _cache_simulacoes[chave] = resultado
+        while len(_cache_simulacoes) > MAX_SIMULACOES_EM_CACHE:
+            _cache_simulacoes.popitem(last=False)
+    return resultado
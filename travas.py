@@ -0,0 +1,67 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: fica só a trava entre threads do mesmo processo
+
+# --- TRAVAS POR ARQUIVO (THREADS E PROCESSOS) ---
+# Paciente e cuidador costumam estar logados no mesmo usuário em dois celulares, e o
+# app pode rodar em mais de um processo. Cada arquivo de dados ganha um "<raiz>.lock"
+# ao lado; quem for escrever (ou ler vários arquivos de uma vez) segura:
+#   1. uma RLock do processo (threads/sessões do Streamlit), e
+#   2. um flock exclusivo no .lock (outros processos).
+# A trava é reentrante: o flock só é pedido na primeira entrada da thread que a segura.
+
+
+class TravaArquivo:
+    def __init__(self, caminho_lock):
+        self.caminho_lock = caminho_lock
+        self._rlock = threading.RLock()
+        self._nivel = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._rlock.acquire()
+        if self._nivel == 0 and fcntl is not None:
+            try:
+                self._fd = self._travar_processo()
+            except BaseException:
+                self._rlock.release()
+                raise
+        self._nivel += 1
+        return self
+
+    def _travar_processo(self):
+        fd = os.open(self.caminho_lock, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    def __exit__(self, *erro):
+        self._nivel -= 1
+        if self._nivel == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._rlock.release()
+        return False
+
+
+_travas = {}
+_travas_guarda = threading.Lock()
+
+def caminho_trava(caminho):
+    return os.path.splitext(caminho)[0] + ".lock"
+
+def trava_arquivo(caminho):
+    # Uma trava por arquivo (mesmo caminho = mesmo objeto em todo o processo)
+    caminho_lock = os.path.abspath(caminho_trava(caminho))
+    with _travas_guarda:
+        if caminho_lock not in _travas:
+            _travas[caminho_lock] = TravaArquivo(caminho_lock)
+        return _travas[caminho_lock]
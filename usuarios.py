@@ -0,0 +1,224 @@
+import os
+import sqlite3
+import threading
+from travas import trava_arquivo
+
+# --- CADASTRO DE USUÁRIOS ---
+# Dois backends com a mesma interface:
+#   "sqlite" (padrão): usuarios.db com chave primária no usuário normalizado,
+#                      cada operação é uma transação de uma linha só.
+#   "csv":             o antigo usuarios_cadastrados.csv, lido inteiro a cada operação;
+#                      as alterações seguram a trava do arquivo (threads e processos)
+#                      e regravam o CSV por arquivo temporário + rename.
+# Escolha com a variável de ambiente CALC_BANCO_USUARIOS.
+
+ARQUIVO_USUARIOS = "usuarios_cadastrados.csv"
+ARQUIVO_USUARIOS_DB = "usuarios.db"
+COLUNAS_USUARIOS = ["usuario", "senha", "palavra_secreta"]
+
+
+# --- NORMALIZAÇÃO (IGUAL PARA TODOS OS BACKENDS) ---
+def normalizar_usuario(usuario):
+    return str(usuario).lower().strip().replace(" ", "")
+
+def normalizar_senha(senha):
+    return str(senha).strip()
+
+def normalizar_palavra(palavra_secreta):
+    return str(palavra_secreta).lower().strip()
+
+
+# --- BACKEND CSV (LEGADO) ---
+class BancoUsuariosCSV:
+    def __init__(self, arquivo=ARQUIVO_USUARIOS):
+        self.arquivo = arquivo
+
+    def _carregar(self):
+        import pandas as pd
+        if os.path.exists(self.arquivo):
+            # DTYPE=STR É O SEGREDO: FORÇA TUDO A SER TEXTO
+            df = pd.read_csv(self.arquivo, dtype=str).fillna("")
+            df['usuario'] = df['usuario'].astype(str).str.lower().str.strip()
+            df['senha'] = df['senha'].astype(str).str.strip()
+            df['palavra_secreta'] = df['palavra_secreta'].astype(str).str.lower().str.strip()
+            return df
+        return pd.DataFrame(columns=COLUNAS_USUARIOS)
+
+    def _gravar(self, df):
+        tmp = self.arquivo + ".tmp"
+        with open(tmp, "w", newline="") as f:
+            df.to_csv(f, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.arquivo)
+
+    def inserir(self, usuario, senha, palavra_secreta):
+        import pandas as pd
+        # Ler, conferir e gravar dentro da mesma trava: dois cadastros simultâneos
+        # não podem apagar um ao outro
+        with trava_arquivo(self.arquivo):
+            df = self._carregar()
+            if usuario in df['usuario'].values:
+                return False
+            novo = pd.DataFrame([{"usuario": usuario, "senha": senha, "palavra_secreta": palavra_secreta}])
+            self._gravar(pd.concat([df, novo], ignore_index=True))
+        return True
+
+    def conferir_senha(self, usuario, senha):
+        df = self._carregar()
+        return not df[(df['usuario'] == usuario) & (df['senha'] == senha)].empty
+
+    def trocar_senha(self, usuario, palavra_secreta, nova_senha):
+        with trava_arquivo(self.arquivo):
+            df = self._carregar()
+            mask = (df['usuario'] == usuario) & (df['palavra_secreta'] == palavra_secreta)
+            if df[mask].empty:
+                return False
+            df.loc[mask, 'senha'] = nova_senha
+            self._gravar(df)
+        return True
+
+    def listar(self):
+        return self._carregar()['usuario'].tolist()
+
+    def vazio(self):
+        return self._carregar().empty
+
+    def apagar_tudo(self):
+        with trava_arquivo(self.arquivo):
+            if os.path.exists(self.arquivo):
+                os.remove(self.arquivo)
+                return True
+        return False
+
+
+# --- BACKEND SQLITE ---
+class BancoUsuariosSQLite:
+    def __init__(self, arquivo=ARQUIVO_USUARIOS_DB, arquivo_csv_antigo=ARQUIVO_USUARIOS):
+        self.arquivo = arquivo
+        self.arquivo_csv_antigo = arquivo_csv_antigo
+        self._local = threading.local()
+        self._criar_tabela()
+        self.migrar_csv()
+
+    def _conexao(self):
+        # Uma conexão por thread: cada sessão do Streamlit roda na sua própria thread
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.arquivo, timeout=10, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("PRAGMA busy_timeout=10000")
+            self._local.con = con
+        return con
+
+    def _criar_tabela(self):
+        self._conexao().execute(
+            "CREATE TABLE IF NOT EXISTS usuarios ("
+            " usuario TEXT PRIMARY KEY,"
+            " senha TEXT NOT NULL,"
+            " palavra_secreta TEXT NOT NULL)"
+        )
+
+    def migrar_csv(self):
+        # Migração única: importa o CSV antigo e o renomeia para não importar de novo
+        if not self.arquivo_csv_antigo or not os.path.exists(self.arquivo_csv_antigo):
+            return 0
+        with trava_arquivo(self.arquivo_csv_antigo):
+            antigos = BancoUsuariosCSV(self.arquivo_csv_antigo)._carregar()
+        linhas = [
+            (normalizar_usuario(r.usuario), normalizar_senha(r.senha), normalizar_palavra(r.palavra_secreta))
+            for r in antigos.itertuples(index=False)
+            if normalizar_usuario(r.usuario)
+        ]
+        con = self._conexao()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            antes = con.total_changes
+            con.executemany("INSERT OR IGNORE INTO usuarios VALUES (?, ?, ?)", linhas)
+            migrados = con.total_changes - antes
+            con.execute("COMMIT")
+        except:
+            con.execute("ROLLBACK")
+            raise
+        try:
+            os.replace(self.arquivo_csv_antigo, self.arquivo_csv_antigo + ".migrado")
+        except FileNotFoundError:
+            pass  # outro processo migrou ao mesmo tempo; INSERT OR IGNORE já evitou duplicatas
+        return migrados
+
+    def inserir(self, usuario, senha, palavra_secreta):
+        try:
+            self._conexao().execute(
+                "INSERT INTO usuarios VALUES (?, ?, ?)", (usuario, senha, palavra_secreta)
+            )
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def conferir_senha(self, usuario, senha):
+        cur = self._conexao().execute("SELECT senha FROM usuarios WHERE usuario = ?", (usuario,))
+        linha = cur.fetchone()
+        return linha is not None and linha[0] == senha
+
+    def trocar_senha(self, usuario, palavra_secreta, nova_senha):
+        cur = self._conexao().execute(
+            "UPDATE usuarios SET senha = ? WHERE usuario = ? AND palavra_secreta = ?",
+            (nova_senha, usuario, palavra_secreta),
+        )
+        return cur.rowcount > 0
+
+    def listar(self):
+        return [r[0] for r in self._conexao().execute("SELECT usuario FROM usuarios ORDER BY usuario")]
+
+    def vazio(self):
+        return self._conexao().execute("SELECT 1 FROM usuarios LIMIT 1").fetchone() is None
+
+    def apagar_tudo(self):
+        cur = self._conexao().execute("DELETE FROM usuarios")
+        return cur.rowcount > 0
+
+
+# --- ESCOLHA DO BACKEND ---
+_banco = None
+_banco_guarda = threading.Lock()
+
+def obter_banco():
+    global _banco
+    with _banco_guarda:
+        if _banco is None:
+            tipo = os.environ.get("CALC_BANCO_USUARIOS", "sqlite").lower()
+            _banco = BancoUsuariosCSV() if tipo == "csv" else BancoUsuariosSQLite()
+        return _banco
+
+
+# --- OPERAÇÕES USADAS PELA TELA DE LOGIN ---
+def cadastrar_usuario(usuario, senha, palavra_secreta):
+    # Converte tudo para string e limpa espaços
+    usuario = normalizar_usuario(usuario)
+    senha = normalizar_senha(senha)
+    palavra_secreta = normalizar_palavra(palavra_secreta)
+
+    if len(usuario) < 3: return False, "❌ O usuário deve ter pelo menos 3 letras."
+    if len(senha) < 4: return False, "❌ A senha deve ter pelo menos 4 caracteres."
+    if len(palavra_secreta) < 2: return False, "❌ A palavra secreta é muito curta."
+
+    if not obter_banco().inserir(usuario, senha, palavra_secreta):
+        return False, "❌ Este usuário já existe! Tente outro."
+    return True, "✅ Cadastro realizado com sucesso!"
+
+def verificar_login(usuario, senha):
+    return obter_banco().conferir_senha(str(usuario).lower().strip(), normalizar_senha(senha))
+
+def resetar_senha(usuario, palavra_secreta, nova_senha):
+    banco = obter_banco()
+    if banco.vazio(): return False, "❌ Nenhum usuário cadastrado."
+    if banco.trocar_senha(str(usuario).lower().strip(), normalizar_palavra(palavra_secreta), normalizar_senha(nova_senha)):
+        return True, "✅ Senha alterada com sucesso!"
+    return False, "❌ Usuário ou Palavra Secreta incorretos."
+
+def listar_usuarios():
+    return obter_banco().listar()
+
+def apagar_todos():
+    return obter_banco().apagar_tudo()